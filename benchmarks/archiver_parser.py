@@ -0,0 +1,154 @@
+"""archiver.php 解析基准
+
+对比原先基于 BeautifulSoup 的解析与 utils/archiver.py 的正则解析：
+1. 在 fixtures/archiver 下的页面上校验两者结果一致
+2. 校验 server / client 两份 archiver.py 内容相同
+3. 使用 timeit 统计耗时
+
+用法：python benchmarks/archiver_parser.py [-n 次数]
+依赖 beautifulsoup4（仅基准需要）。
+"""
+
+import argparse
+import importlib.util
+import re
+import timeit
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "archiver"
+SERVER_ARCHIVER = ROOT / "server" / "utils" / "archiver.py"
+CLIENT_ARCHIVER = ROOT / "client" / "utils" / "archiver.py"
+
+
+def load_archiver():
+    spec = importlib.util.spec_from_file_location("archiver", SERVER_ARCHIVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+archiver = load_archiver()
+
+
+# ---- 原实现（server/utils/ehentai.py、client/utils/ehentai.py、client/utils/status.py） ----
+
+
+def old_server_strongs(html):
+    soup = BeautifulSoup(html, "html.parser")
+    GPs = soup.find_all("strong")
+    return [x.text for x in GPs]
+
+
+def old_client_cost(html, image_quality):
+    soup = BeautifulSoup(html, "html.parser")
+    GPs = soup.find_all("strong")
+    if image_quality == "org":
+        if GPs[0].text == "Free!":
+            client_GP_cost = 0
+        else:
+            client_GP_cost = "".join([ch for ch in GPs[0].text if ch.isdigit()])
+    else:
+        if GPs[2].text == "Free!":
+            client_GP_cost = 0
+        else:
+            client_GP_cost = "".join([ch for ch in GPs[2].text if ch.isdigit()])
+    return client_GP_cost
+
+
+def old_status(html):
+    status = {}
+    soup = BeautifulSoup(html, "html.parser")
+    divs_with_left = soup.find("div", style=lambda value: value and "left" in value)
+    if divs_with_left:
+        strong = divs_with_left.find_all("strong")
+        if strong[0].text == "Free!":
+            status["Free"] = 1
+        else:
+            status["Free"] = 0
+    p_tag = soup.find_all("p")[1] if len(soup.find_all("p")) > 1 else None
+    if p_tag:
+        G_and_C = re.sub(r"[^a-zA-Z0-9]", "", p_tag.get_text(strip=True)).split("GP")
+        if len(G_and_C) == 2:
+            GC = [G_and_C[0], G_and_C[1].replace("Credits", "")]
+            status["GP"] = GC[0]
+            status["Credits"] = GC[1]
+    return status
+
+
+# ---- 新实现 ----
+
+
+def new_server_strongs(html):
+    return archiver.archiver_strongs(html)
+
+
+def new_client_cost(html, image_quality):
+    GPs = archiver.archiver_strongs(html)
+    return archiver.cost_to_GP(GPs[0] if image_quality == "org" else GPs[2])
+
+
+def new_status(html):
+    status = {}
+    free = archiver.parse_free(html)
+    if free is not None:
+        status["Free"] = free
+    if balance := archiver.parse_balance(html):
+        status["GP"], status["Credits"] = balance
+    return status
+
+
+CASES = [
+    ("server get_GP_cost", old_server_strongs, new_server_strongs, {}),
+    ("client get_GP_cost", old_client_cost, new_client_cost, {"image_quality": "org"}),
+    ("client get_status", old_status, new_status, {}),
+]
+
+
+def check(pages):
+    assert SERVER_ARCHIVER.read_bytes() == CLIENT_ARCHIVER.read_bytes(), (
+        "server/utils/archiver.py 与 client/utils/archiver.py 不一致"
+    )
+    for name, html in pages.items():
+        if name == "bounce.html":
+            assert archiver.is_login_bounce("https://e-hentai.org/", html)
+            assert old_server_strongs(html) == new_server_strongs(html) == []
+            assert old_status(html) == new_status(html) == {}
+            continue
+        assert not archiver.is_login_bounce("https://exhentai.org/", html)
+        for label, old, new, kwargs in CASES:
+            old_result, new_result = old(html, **kwargs), new(html, **kwargs)
+            assert old_result == new_result, f"{name} {label}: {old_result!r} != {new_result!r}"
+        for quality in ("org", "res"):
+            assert old_client_cost(html, quality) == new_client_cost(html, quality)
+
+
+def bench(pages, number):
+    print(f"{'fixture':<18}{'case':<22}{'bs4 (ms)':>10}{'regex (ms)':>12}{'speedup':>10}")
+    for name, html in pages.items():
+        if name == "bounce.html":
+            continue
+        for label, old, new, kwargs in CASES:
+            old_time = timeit.timeit(lambda: old(html, **kwargs), number=number)
+            new_time = timeit.timeit(lambda: new(html, **kwargs), number=number)
+            print(
+                f"{name:<18}{label:<22}{old_time / number * 1000:>10.3f}"
+                f"{new_time / number * 1000:>12.4f}{old_time / new_time:>9.1f}x"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=200)
+    args = parser.parse_args()
+
+    pages = {path.name: path.read_text(encoding="utf-8") for path in sorted(FIXTURES.glob("*.html"))}
+    check(pages)
+    print(f"{len(pages)} 个页面解析结果一致\n")
+    bench(pages, args.number)
+
+
+if __name__ == "__main__":
+    main()
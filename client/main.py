@@ -1,54 +1,143 @@
+import asyncio
 import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from loguru import logger
 
 from config.config import config
-from utils.ehentai import get_download_url, get_GP_cost
-from utils.status import GP_usage_log, get_status
+from utils.accounts import Account, pick_accounts
+from utils.ehentai import get_download_url, get_GP_cost, wait_invalidate_tasks
+from utils.heartbeat import heartbeat
+from utils.metrics import GP_spent_total, render_metrics, resolve_seconds, resolve_total
+from utils.scheduler import SchedulerBusy
+from utils.status import (
+    get_status_snapshot,
+    status_changed,
+    status_refresher,
+    trigger_status_refresh,
+)
 
 logger.add("log.log", encoding="utf-8")
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 站点探测在后台进行，不阻塞服务启动
+    refresher = asyncio.create_task(status_refresher())
+    # 向服务端推送状态
+    pusher = asyncio.create_task(heartbeat())
+    yield
+    refresher.cancel()
+    pusher.cancel()
+    await wait_invalidate_tasks()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# 服务端提供的 GP 消耗在此时长(秒)内视为有效
+EXPECTED_GP_MAX_AGE = config.get("expected_GP_max_age", 300)
+
+
+async def resolve_GP_cost(account: Account, data):
+    """确定本次归档的 GP 消耗
+
+    服务端附带的消耗足够新，且该账号没有免费配额（实际消耗与服务端所见一致）时直接使用，
+    否则查询 archiver.php
+    """
+    expected = data.get("expected_GP")
+    age = data.get("expected_GP_age")
+    if (
+        expected is not None
+        and age is not None
+        and float(age) < EXPECTED_GP_MAX_AGE
+        and account.status["Free"] == 0
+    ):
+        return int(expected)
+    return int(
+        await get_GP_cost(account, data["gid"], data["token"], data["image_quality"])
+    )
+
+
+async def resolve_with_account(account: Account, data):
+    """使用指定账号归档，返回 (msg, d_url, require_GP)"""
+    async with account.scheduler.slot():
+        require_GP = await resolve_GP_cost(account, data)
+        # 超出该账号的 GP 限额时拒绝，由下一个账号尝试
+        if not account.can_spend(require_GP):
+            return "Rejected", None, require_GP
+        d_url = await get_download_url(
+            account, data["gid"], data["token"], data["image_quality"]
+        )
+        if account.max_GP_cost > 0:
+            account.GP_budget.add(require_GP)
+        GP_spent_total.inc(max(require_GP, 0), account=account.name)
+        trigger_status_refresh(account)
+        return "Success", d_url, require_GP
 
 
 @app.post("/resolve")
 async def resolve(request: Request):
+    start = time.perf_counter()
     try:
         data = await request.json()
         gid = data["gid"]
         token = data["token"]
-        image_quality = data["image_quality"]
-        require_GP = int(await get_GP_cost(gid, token, image_quality))
-        if config["ehentai"]["max_GP_cost"] == 0 and require_GP > 0:
-            msg = "Rejected"
-            d_url = None
+        candidates = pick_accounts()
+        if not candidates:
+            raise RuntimeError("节点尚未就绪")
+
+        # 按优先顺序尝试各账号，全部繁忙时快速拒绝，服务端会转投其他节点
+        msg, d_url, require_GP = "Busy", None, None
+        for account in candidates:
+            try:
+                msg, d_url, require_GP = await resolve_with_account(account, data)
+                used = account
+            except SchedulerBusy:
+                resolve_total.inc(account=account.name, outcome="Busy")
+                continue
+            except Exception:
+                resolve_total.inc(account=account.name, outcome="Failed")
+                trigger_status_refresh(account)
+                raise
+            resolve_total.inc(account=account.name, outcome=msg)
+            if msg == "Success":
+                break
+
+        if msg == "Busy":
+            # 让服务端尽快得知节点繁忙
+            status_changed.set()
+            logger.warning(f"归档队列已满，拒绝 https://e-hentai.org/g/{gid}/{token}/")
         else:
-            d_url = await get_download_url(gid, token, image_quality)
-            msg = "Success"
-            if config["ehentai"]["max_GP_cost"] > 0:
-                GP_usage_log.append((time.time(), require_GP))
-        logger.info(
-            f"{data['username']} 归档 https://e-hentai.org/g/{gid}/{token}/  需要{require_GP} GP  {msg}"
-        )
+            logger.info(
+                f"{data['username']} 归档 https://e-hentai.org/g/{gid}/{token}/  {used.name} 需要{require_GP} GP  {msg}"
+            )
+        resolve_seconds.observe(time.perf_counter() - start, outcome=msg)
         return JSONResponse(
             content={
                 "msg": msg,
                 "d_url": d_url,
                 "require_GP": require_GP,
-                "status": await get_status(),
+                "status": get_status_snapshot(),
             }
         )
     except Exception as e:
         logger.error(e)
-        return JSONResponse(content={"msg": "Failed", "status": await get_status()})
+        resolve_seconds.observe(time.perf_counter() - start, outcome="Failed")
+        return JSONResponse(content={"msg": "Failed", "status": get_status_snapshot()})
 
 
 @app.get("/status")
 async def status():
-    return JSONResponse(content={"status": await get_status()})
+    return JSONResponse(content={"status": get_status_snapshot()})
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 if __name__ == "__main__":
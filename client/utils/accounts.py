@@ -0,0 +1,106 @@
+import time
+
+from config.config import config
+from utils.gp_budget import GPBudget
+from utils.scheduler import Scheduler
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36 Edg/135.0.0.0"
+
+
+class Account:
+    """节点内的一个 EH 账号，各自维护站点、状态、GP 限额与请求调度"""
+
+    def __init__(self, name: str, settings: dict, GP_budget_file: str):
+        self.name = name
+        self.headers = {"User-Agent": USER_AGENT, "Cookie": settings["cookies"]}
+        # 每日最大 GP 消耗量，-1 为不限制，0 为禁止 GP 消耗
+        self.max_GP_cost = settings.get("max_GP_cost", -1)
+        self.scheduler = Scheduler(
+            settings.get("max_concurrency", config.get("max_concurrency", 2)),
+            settings.get("request_interval", config.get("request_interval", 1)),
+            settings.get("max_queue", config.get("max_queue", 10)),
+        )
+        self.GP_budget = GPBudget(GP_budget_file)
+        # 站点地址由探测确定，探测成功前为 None
+        self.base_url = None
+        self.status = {"EX": "启动中", "Free": "", "GP": "", "Credits": ""}
+        self.status_time = time.time()
+
+    def is_within_GP_limit(self) -> bool:
+        """检查是否仍在 GP 限制范围内"""
+        if self.max_GP_cost == -1:
+            return True  # 无限制
+        if self.max_GP_cost == 0:
+            return False  # 禁止GP消耗
+        return self.GP_budget.used() < self.max_GP_cost
+
+    def can_spend(self, amount: int) -> bool:
+        return amount <= 0 or self.is_within_GP_limit()
+
+    def rank(self) -> tuple:
+        """账号选择顺序：队列未满、有免费配额、未超限额、负载低、GP 多者优先"""
+        queue = self.scheduler
+        GP = self.status["GP"]
+        return (
+            queue.full(),
+            self.status["Free"] != 1,
+            not self.is_within_GP_limit(),
+            queue.waiting + queue.in_flight,
+            -int(GP) if str(GP).isdigit() else 0,
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "msg": self.status,
+            "enable_GP_cost": self.is_within_GP_limit(),
+            "age": round(time.time() - self.status_time),
+            "queue": self.scheduler.stats(),
+        }
+
+
+def load_accounts() -> list[Account]:
+    """读取账号配置，未配置 accounts 时使用 ehentai 中的单个账号"""
+    if config.get("accounts"):
+        return [
+            Account(
+                name := str(item.get("name", index)),
+                item,
+                item.get("GP_budget_file", f"data/GP_budget_{name}.json"),
+            )
+            for index, item in enumerate(config["accounts"])
+        ]
+    return [
+        Account(
+            "default",
+            config["ehentai"],
+            config.get("GP_budget_file", "data/GP_budget.json"),
+        )
+    ]
+
+
+accounts = load_accounts()
+
+
+def pick_accounts() -> list[Account]:
+    """按优先顺序返回已就绪的账号"""
+    return sorted((a for a in accounts if a.base_url), key=Account.rank)
+
+
+def aggregate_status() -> dict:
+    """节点整体状态，兼容单账号时的格式
+
+    EX / Free 取所有账号中最好的情况，GP / Credits 取 GP 最多的账号
+    """
+    statuses = [a.status for a in accounts]
+    richest = max(
+        statuses, key=lambda s: int(s["GP"]) if str(s["GP"]).isdigit() else -1
+    )
+    EX = next(
+        (ex for ex in ("EX", "EH") if any(s["EX"] == ex for s in statuses)),
+        statuses[0]["EX"],
+    )
+    Free = next(
+        (free for free in (1, 0) if any(s["Free"] == free for s in statuses)), ""
+    )
+    return {"EX": EX, "Free": Free, "GP": richest["GP"], "Credits": richest["Credits"]}
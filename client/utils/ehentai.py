@@ -1,66 +1,149 @@
+import asyncio
 import re
+import time
+from urllib.parse import urlsplit
 
 import httpx
-from bs4 import BeautifulSoup
 from loguru import logger
 
 from config.config import config
-
-http = httpx.AsyncClient(proxy=config["proxy"])
+from utils.accounts import Account
+from utils.archiver import archiver_strongs, cost_to_GP
+from utils.metrics import (
+    archiver_seconds,
+    connect_seconds,
+    eh_requests_total,
+    pace_wait_seconds,
+)
+
+# 安装了 h2 时启用 HTTP/2，同一站点的请求复用一条连接
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# 所有账号共用同一个连接池，长连接避免每次请求都重新经过代理握手
+http = httpx.AsyncClient(
+    proxy=config["proxy"],
+    http2=HTTP2,
+    limits=httpx.Limits(
+        max_connections=config.get("max_connections", 20),
+        max_keepalive_connections=config.get("max_keepalive_connections", 10),
+        keepalive_expiry=config.get("keepalive_expiry", 120),
+    ),
+    timeout=httpx.Timeout(
+        config.get("request_timeout", 30), connect=config.get("connect_timeout", 10)
+    ),
+)
 
 
 EX_BASE_URL = "https://exhentai.org"
 EH_BASE_URL = "https://e-hentai.org"
 
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36 Edg/135.0.0.0",
-    "Cookie": config["ehentai"]["cookies"],
-}
+PROBE_TIMEOUT = config.get("probe_timeout", 10)
+
+
+class ConnectionTrace:
+    """通过 httpx 的 trace 扩展记录请求是否新建了连接及建连耗时"""
+
+    def __init__(self):
+        self.started = None
+        self.connect_time = None
 
+    async def __call__(self, event_name: str, info: dict):
+        # 事件名前缀随连接方式不同：直连为 connection.，SOCKS 代理为 socks.，
+        # HTTP 代理隧道中的 TLS 握手为 proxy.start_tls，只按后缀匹配
+        _, _, event = event_name.partition(".")
+        if event == "connect_tcp.started" and self.started is None:
+            self.started = time.perf_counter()
+        elif event in (
+            "connect_tcp.complete",
+            "start_tls.complete",
+        ) and self.started is not None:
+            self.connect_time = time.perf_counter() - self.started
 
-def _get_base_url():
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """经连接池发送 EH 请求，并统计连接复用情况"""
+    trace = ConnectionTrace()
     try:
-        res = httpx.get(EX_BASE_URL, headers=headers, proxy=config["proxy"])
+        return await http.request(method, url, extensions={"trace": trace}, **kwargs)
+    finally:
+        host = urlsplit(url).hostname
+        if trace.started is None:
+            eh_requests_total.inc(host=host, connection="reused")
+        else:
+            eh_requests_total.inc(host=host, connection="new")
+            if trace.connect_time is not None:
+                connect_seconds.observe(trace.connect_time, host=host)
+
+
+async def prewarm():
+    """启动时预先建立到各站点的连接"""
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[
+            request("HEAD", url, timeout=PROBE_TIMEOUT)
+            for url in (EX_BASE_URL, EH_BASE_URL)
+        ],
+        return_exceptions=True,
+    )
+    failed = [str(r) for r in results if isinstance(r, Exception)]
+    logger.info(
+        f"连接预热完成，耗时 {time.perf_counter() - start:.2f} 秒，HTTP/2：{'是' if HTTP2 else '否'}"
+        + (f"，失败：{failed}" if failed else "")
+    )
+
+
+async def _get_base_url(account: Account):
+    """探测账号可访问的站点，成功时同时更新 account.base_url"""
+    try:
+        res = await request(
+            "GET", EX_BASE_URL, headers=account.headers, timeout=PROBE_TIMEOUT
+        )
         if res.text != "":
-            return EX_BASE_URL
+            account.base_url = EX_BASE_URL
         else:
-            res = httpx.get(EH_BASE_URL, headers=headers, proxy=config["proxy"])
-            return EH_BASE_URL
-    except TimeoutError:
+            res = await request(
+                "GET", EH_BASE_URL, headers=account.headers, timeout=PROBE_TIMEOUT
+            )
+            account.base_url = EH_BASE_URL
+        return account.base_url
+    except httpx.TimeoutException:
         return "访问超时"
     except Exception as e:
         logger.error(e)
         return "错误"
 
 
-base_url = _get_base_url()
-
-
-async def _archiver(gid, token, data=None):
-    url = f"{base_url}/archiver.php?gid={gid}&token={token}"
-    response = await http.post(url, headers=headers, data=data)
+async def _archiver(account: Account, gid, token, data=None):
+    if account.base_url is None:
+        raise RuntimeError("节点尚未就绪")
+    url = f"{account.base_url}/archiver.php?gid={gid}&token={token}"
+    with pace_wait_seconds.time(account=account.name):
+        await account.scheduler.pace()
+    if data is None:
+        phase = "cost"
+    elif "invalidate_sessions" in data:
+        phase = "invalidate"
+    else:
+        phase = "download"
+    with archiver_seconds.time(account=account.name, phase=phase):
+        response = await request("POST", url, headers=account.headers, data=data)
     return response.text
 
 
-async def get_GP_cost(gid, token, image_quality):
-    response = await _archiver(gid, token)
-    soup = BeautifulSoup(response, "html.parser")
-    GPs = soup.find_all("strong")
-    if image_quality == "org":
-        if GPs[0].text == "Free!":
-            client_GP_cost = 0
-        else:
-            client_GP_cost = "".join([ch for ch in GPs[0].text if ch.isdigit()])
-    else:
-        if GPs[2].text == "Free!":
-            client_GP_cost = 0
-        else:
-            client_GP_cost = "".join([ch for ch in GPs[2].text if ch.isdigit()])
-    return client_GP_cost
+async def get_GP_cost(account: Account, gid, token, image_quality):
+    response = await _archiver(account, gid, token)
+    GPs = archiver_strongs(response)
+    return cost_to_GP(GPs[0] if image_quality == "org" else GPs[2])
 
 
-async def get_download_url(gid, token, image_quality):
+async def get_download_url(account: Account, gid, token, image_quality):
     response = await _archiver(
+        account,
         gid,
         token,
         {
@@ -71,5 +154,37 @@ async def get_download_url(gid, token, image_quality):
     d_url = re.search(r'document\.location = "(.*?)";', response, re.DOTALL).group(1)
     if not d_url:
         raise RuntimeError("归档链接获取失败")
-    await _archiver(gid, token, {"invalidate_sessions": "1"})
+    # 链接解析后即可返回，会话失效在后台完成
+    schedule_invalidate_sessions(account, gid, token)
     return f"{d_url.removesuffix('?autostart=1')}?start=1"
+
+
+# 后台进行中的会话失效任务，保留引用避免被回收，退出时等待完成
+invalidate_tasks = set()
+INVALIDATE_RETRIES = 3
+
+
+async def invalidate_sessions(account: Account, gid, token):
+    """使归档会话失效，失败时退避重试"""
+    for attempt in range(INVALIDATE_RETRIES):
+        try:
+            await _archiver(account, gid, token, {"invalidate_sessions": "1"})
+            return
+        except Exception as e:
+            logger.warning(
+                f"{account.name} 画廊 {gid} 会话失效失败（第 {attempt + 1} 次）：{e}"
+            )
+            await asyncio.sleep(2**attempt)
+    logger.error(f"{account.name} 画廊 {gid} 会话失效失败，已放弃")
+
+
+def schedule_invalidate_sessions(account: Account, gid, token):
+    task = asyncio.create_task(invalidate_sessions(account, gid, token))
+    invalidate_tasks.add(task)
+    task.add_done_callback(invalidate_tasks.discard)
+
+
+async def wait_invalidate_tasks(timeout: float = 10):
+    """退出前等待未完成的会话失效任务"""
+    if invalidate_tasks:
+        await asyncio.wait(set(invalidate_tasks), timeout=timeout)
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from collections import deque
+
+from loguru import logger
+
+
+class GPBudget:
+    """滑动窗口内的 GP 消耗统计
+
+    - 消耗按时间分桶累加，并维护窗口内的总量，查询为 O(1)（均摊）
+    - 桶整体超出窗口后才移除，统计偏保守，最多多计一个桶的时长
+    - 每次记录消耗后写入本地文件，节点重启后仍保留当日用量
+    """
+
+    def __init__(self, path: str, window: int = 86400, bucket: int = 60):
+        self.path = path
+        self.window = window
+        self.bucket = bucket
+        self.buckets = deque()  # [桶起始时间, GP]
+        self.total = 0
+        self._load()
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        while self.buckets and self.buckets[0][0] + self.bucket <= cutoff:
+            self.total -= self.buckets.popleft()[1]
+
+    def add(self, amount: int):
+        """记录一次 GP 消耗"""
+        if amount <= 0:
+            return
+        now = time.time()
+        start = now - now % self.bucket
+        if self.buckets and self.buckets[-1][0] == start:
+            self.buckets[-1][1] += amount
+        else:
+            self.buckets.append([start, amount])
+        self.total += amount
+        self._trim(now)
+        self._save()
+
+    def used(self) -> int:
+        """窗口内已消耗的 GP"""
+        self._trim(time.time())
+        return self.total
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            self.buckets = deque([float(start), int(gp)] for start, gp in data["buckets"])
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"读取 GP 用量记录失败：{e}")
+            return
+        self.total = sum(gp for _, gp in self.buckets)
+        self._trim(time.time())
+
+    def _save(self):
+        # 先写临时文件再替换，避免写入中断导致记录损坏
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump({"buckets": list(self.buckets)}, file)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"保存 GP 用量记录失败：{e}")
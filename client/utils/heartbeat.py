@@ -0,0 +1,42 @@
+import asyncio
+from urllib.parse import urljoin
+
+import httpx
+from loguru import logger
+
+from config.config import config
+from utils.status import get_status_snapshot, status_changed
+
+# 服务端地址与推送凭证（在 bot 的节点管理中查看），未配置时不推送
+SERVER_URL = config.get("server_url")
+PUSH_KEY = config.get("push_key")
+HEARTBEAT_INTERVAL = config.get("heartbeat_interval", 60)
+
+# 服务端不走访问 EH 用的代理
+server_http = httpx.AsyncClient(timeout=10)
+
+
+async def push_status():
+    response = await server_http.post(
+        urljoin(SERVER_URL, "/client/heartbeat"),
+        json={"push_key": PUSH_KEY, "status": get_status_snapshot()},
+    )
+    data = response.json()
+    if data["code"] != 0:
+        logger.error(f"推送状态失败：{data['msg']}")
+
+
+async def heartbeat():
+    """状态变化时立即推送，否则按固定间隔推送"""
+    if not (SERVER_URL and PUSH_KEY):
+        return
+    while True:
+        try:
+            await asyncio.wait_for(status_changed.wait(), HEARTBEAT_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        status_changed.clear()
+        try:
+            await push_status()
+        except Exception as e:
+            logger.warning(f"推送状态失败：{e}")
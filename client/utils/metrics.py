@@ -0,0 +1,198 @@
+"""Prometheus 文本格式的节点指标
+
+只实现用到的 Counter / Histogram / Gauge，不引入 prometheus_client 依赖。
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from utils.accounts import accounts
+
+# 默认分桶(秒)，覆盖 EH 请求从几十毫秒到超时的范围
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labels, key)} {value}"
+            for key, value in self.values.items()
+        ]
+
+
+class Gauge(Metric):
+    """采集时调用 collect 获取当前值，返回 {标签值元组: 数值}"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple, collect):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labels, key)} {value}"
+            for key, value in self.collect().items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: tuple = (), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # key -> [各分桶计数, 总和, 总数]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts, total, count = self.values.get(key) or ([0] * len(self.buckets), 0, 0)
+        index = bisect_left(self.buckets, value)
+        if index < len(counts):
+            counts[index] += 1
+        self.values[key] = [counts, total + value, count + 1]
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+archiver_seconds = Histogram(
+    "archive_archiver_request_seconds",
+    "archiver.php 请求耗时，phase 为 cost / download / invalidate",
+    ("account", "phase"),
+)
+pace_wait_seconds = Histogram(
+    "archive_pace_wait_seconds", "等待 EH 请求间隔的时间", ("account",)
+)
+resolve_seconds = Histogram(
+    "archive_resolve_seconds", "/resolve 处理耗时", ("outcome",)
+)
+resolve_total = Counter(
+    "archive_resolve_total",
+    "/resolve 结果计数，outcome 为 Success / Rejected / Busy / Failed",
+    ("account", "outcome"),
+)
+GP_spent_total = Counter("archive_gp_spent_total", "已消耗的 GP", ("account",))
+status_refresh_seconds = Histogram(
+    "archive_status_refresh_seconds", "账号状态刷新耗时", ("account",)
+)
+status_refresh_errors_total = Counter(
+    "archive_status_refresh_errors_total", "账号状态刷新失败次数", ("account",)
+)
+in_flight = Gauge(
+    "archive_in_flight",
+    "进行中的归档操作数",
+    ("account",),
+    lambda: {(a.name,): a.scheduler.in_flight for a in accounts},
+)
+queue_waiting = Gauge(
+    "archive_queue_waiting",
+    "等待中的归档操作数",
+    ("account",),
+    lambda: {(a.name,): a.scheduler.waiting for a in accounts},
+)
+GP_budget_used = Gauge(
+    "archive_gp_budget_used",
+    "近 24 小时已消耗的 GP",
+    ("account",),
+    lambda: {(a.name,): a.GP_budget.used() for a in accounts},
+)
+account_up = Gauge(
+    "archive_account_up",
+    "账号是否可访问 EH / EX 站点",
+    ("account",),
+    lambda: {(a.name,): int(a.status["EX"] in ("EX", "EH")) for a in accounts},
+)
+eh_requests_total = Counter(
+    "archive_eh_requests_total",
+    "发往 EH 的请求数，connection 为 new（新建连接）/ reused（复用连接）",
+    ("host", "connection"),
+)
+connect_seconds = Histogram(
+    "archive_eh_connect_seconds", "新建连接耗时（TCP、代理与 TLS 握手）", ("host",)
+)
+
+
+def _connect_saved() -> dict:
+    """复用连接省去的建连时间，按该站点新建连接的平均耗时估算"""
+    saved = {}
+    for (host,), (_, total, count) in connect_seconds.values.items():
+        reused = eh_requests_total.values.get((host, "reused"), 0)
+        saved[(host,)] = total / count * reused
+    return saved
+
+
+connect_saved_seconds = Gauge(
+    "archive_eh_connect_saved_seconds",
+    "复用连接省去的建连时间估算",
+    ("host",),
+    _connect_saved,
+)
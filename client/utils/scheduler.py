@@ -0,0 +1,65 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class SchedulerBusy(Exception):
+    """等待队列已满"""
+
+
+class Scheduler:
+    """归档请求调度
+
+    - 同时进行的归档操作不超过 max_concurrency
+    - 发往 EH 的请求之间至少间隔 min_interval 秒
+    - 等待中的操作超过 max_queue 时直接拒绝，由服务端转投其他节点
+    """
+
+    def __init__(self, max_concurrency: int, min_interval: float, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pace_lock = asyncio.Lock()
+        self._last_request = 0.0
+
+    def full(self) -> bool:
+        return self.waiting >= self.max_queue and self._semaphore.locked()
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个归档名额，队列已满时抛出 SchedulerBusy"""
+        if self.full():
+            self.rejected += 1
+            raise SchedulerBusy
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def pace(self):
+        """发往 EH 的请求前调用，保证最小请求间隔"""
+        async with self._pace_lock:
+            delay = self._last_request + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last_request = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
@@ -1,44 +1,43 @@
-import re
+import asyncio
 import time
-from collections import deque
 
-import httpx
-from bs4 import BeautifulSoup
 from loguru import logger
 
 from config.config import config
-from utils.ehentai import _get_base_url
+from utils.accounts import Account, accounts, aggregate_status
+from utils.archiver import parse_balance, parse_free
+from utils.ehentai import PROBE_TIMEOUT, _get_base_url, prewarm, request
+from utils.metrics import status_refresh_errors_total, status_refresh_seconds
 
-GP_usage_log = deque()
+# 后台定时刷新各账号的状态快照，请求处理时直接返回
+STATUS_REFRESH_INTERVAL = config.get("status_refresh_interval", 300)
+_refresh_tasks = {}
+# 状态变化时置位，由心跳任务立即推送给服务端
+status_changed = asyncio.Event()
 
-res = httpx.get("https://e-hentai.org/", proxy=config["proxy"])
-test = re.search(r"https://e-hentai\.org/g/(\d+)/([0-9a-f]{10})", res.text).groups()
+# 启动状态：站点探测成功前以降级状态提供 /status
+startup = {"start_time": time.time(), "ready": False, "ready_seconds": None}
 
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36 Edg/135.0.0.0",
-    "Cookie": config["ehentai"]["cookies"],
-}
 
+async def _get_archiver_status(account: Account):
+    await account.scheduler.pace()
+    return await request(
+        "GET",
+        "https://e-hentai.org/archiver.php?gid=3614913&token=135f66307e",
+        headers=account.headers,
+        timeout=PROBE_TIMEOUT,
+    )
 
-def is_within_global_gp_limit() -> bool:
-    """检查是否仍在 GP 限制范围内"""
-    max_gp = config["ehentai"]["max_GP_cost"]
-    if max_gp == -1:
-        return True  # 无限制
-    if max_gp == 0:
-        return False  # 禁止GP消耗
 
-    now = time.time()
-    one_day_ago = now - 86400
-    while GP_usage_log and GP_usage_log[0][0] < one_day_ago:
-        GP_usage_log.popleft()
-    total_used = sum(gp for _, gp in GP_usage_log)
-    return total_used < max_gp
-
-
-async def get_status():
+async def get_status(account: Account):
     status = {"EX": "", "Free": "", "GP": "", "Credits": ""}
-    text = _get_base_url()
+    # 站点探测与 archiver.php 请求互不依赖，并发执行
+    with status_refresh_seconds.time(account=account.name):
+        text, res = await asyncio.gather(
+            _get_base_url(account),
+            _get_archiver_status(account),
+            return_exceptions=True,
+        )
     if text == "https://exhentai.org":
         status["EX"] = "EX"
     elif text == "https://e-hentai.org":
@@ -46,29 +45,87 @@ async def get_status():
     else:
         status["EX"] = text
     try:
-        res = httpx.get(
-            "https://e-hentai.org/archiver.php?gid=3614913&token=135f66307e",
-            headers=headers,
-            proxy=config["proxy"],
-        )
-        soup = BeautifulSoup(res.text, "html.parser")
-        divs_with_left = soup.find("div", style=lambda value: value and "left" in value)
-        if divs_with_left:
-            strong = divs_with_left.find_all("strong")
-            if strong[0].text == "Free!":
-                status["Free"] = 1
-            else:
-                status["Free"] = 0
-        p_tag = soup.find_all("p")[1] if len(soup.find_all("p")) > 1 else None
-        if p_tag:
-            # 这里是正则替换，将字母和数字字符删除掉
-            G_and_C = re.sub(r"[^a-zA-Z0-9]", "", p_tag.get_text(strip=True)).split(
-                "GP"
-            )
-            if len(G_and_C) == 2:
-                GC = [G_and_C[0], G_and_C[1].replace("Credits", "")]
-                status["GP"] = GC[0]
-                status["Credits"] = GC[1]
+        if isinstance(res, Exception):
+            raise res
+        free = parse_free(res.text)
+        if free is not None:
+            status["Free"] = free
+        if balance := parse_balance(res.text):
+            status["GP"], status["Credits"] = balance
     except Exception as e:
-        logger.error(e)
-    return {"msg": status, "enable_GP_cost": is_within_global_gp_limit()}
+        logger.error(f"{account.name} {e}")
+    if status["EX"] not in ("EX", "EH") or status["GP"] == "":
+        status_refresh_errors_total.inc(account=account.name)
+    return status
+
+
+async def refresh_status(account: Account = None):
+    """刷新状态快照，未指定账号时刷新全部账号"""
+    targets = [account] if account else accounts
+    statuses = await asyncio.gather(*[get_status(a) for a in targets])
+    for target, status in zip(targets, statuses):
+        if status != target.status:
+            status_changed.set()
+        target.status = status
+        target.status_time = time.time()
+
+
+def trigger_status_refresh(account: Account):
+    """归档操作后触发一次后台刷新，该账号已有刷新进行中时不重复发起"""
+    task = _refresh_tasks.get(account.name)
+    if task is None or task.done():
+        _refresh_tasks[account.name] = asyncio.create_task(refresh_status(account))
+
+
+async def wait_until_ready():
+    """启动探测：失败时按指数退避在后台重试，直到任一账号确定可访问的站点"""
+    delay = 5
+    while True:
+        try:
+            await asyncio.wait_for(refresh_status(), PROBE_TIMEOUT * 2)
+            if any(a.status["EX"] in ("EX", "EH") for a in accounts):
+                break
+            reason = "，".join(f"{a.name}：{a.status['EX']}" for a in accounts)
+        except Exception as e:
+            reason = e
+        logger.warning(f"站点探测失败（{reason}），{delay} 秒后重试")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 300)
+
+    startup["ready"] = True
+    startup["ready_seconds"] = round(time.time() - startup["start_time"], 2)
+    status_changed.set()
+    logger.info(f"节点就绪，启动耗时 {startup['ready_seconds']} 秒")
+
+
+async def status_refresher():
+    """预热连接并完成启动探测后定时刷新状态快照"""
+    await prewarm()
+    await wait_until_ready()
+    while True:
+        await asyncio.sleep(STATUS_REFRESH_INTERVAL)
+        try:
+            await refresh_status()
+        except Exception as e:
+            logger.error(f"刷新状态失败：{e}")
+
+
+def get_status_snapshot():
+    """返回节点整体状态与各账号状态，GP 限额实时计算
+
+    顶层 msg / enable_GP_cost / queue 为所有账号汇总，兼容单账号节点的格式
+    """
+    snapshots = [a.snapshot() for a in accounts]
+    queue = {
+        key: sum(s["queue"][key] for s in snapshots)
+        for key in snapshots[0]["queue"]
+    }
+    return {
+        "msg": aggregate_status(),
+        "enable_GP_cost": any(s["enable_GP_cost"] for s in snapshots),
+        "age": max(s["age"] for s in snapshots),
+        "ready": startup["ready"],
+        "startup_seconds": startup["ready_seconds"],
+        "queue": queue,
+        "accounts": snapshots,
+    }
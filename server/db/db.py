@@ -11,6 +11,7 @@ class User(Model):
     name = fields.CharField(max_length=255)
     apikey = fields.UUIDField(default=uuid4)
     group = fields.CharField(max_length=50, default="普通用户")
+    GP_balance = fields.IntField(default=0)  # 有效 GP 余额，随 GPRecord 同步维护
 
     GP_records = fields.ReverseRelation["GPRecord"]
     clients = fields.ReverseRelation["Client"]
@@ -35,6 +36,7 @@ class Client(Model):
     Free = fields.CharField(max_length=255, default="None")
     GP = fields.CharField(max_length=255, default="None")
     Credits = fields.CharField(max_length=255, default="None")
+    push_key = fields.CharField(max_length=36, null=True)  # 节点主动推送状态时的凭证
 
     provider = fields.ForeignKeyField("models.User", related_name="clients")
     archive_histories = fields.ReverseRelation["ArchiveHistory"]
@@ -53,6 +55,18 @@ class ArchiveHistory(Model):
     )
     time = fields.DatetimeField(default=lambda: datetime.now(tz=timezone.utc))
 
+class GalleryCache(Model):
+    gid = fields.CharField(max_length=20)
+    token = fields.CharField(max_length=20)
+    gdata = fields.JSONField(null=True)
+    gdata_time = fields.FloatField(default=0)
+    GP_cost = fields.JSONField(null=True)
+    GP_cost_time = fields.FloatField(default=0)
+
+    class Meta:
+        unique_together = ("gid", "token")
+
+
 class Preview(Model):
     user = fields.ForeignKeyField("models.User", related_name="previeew")
     gid = fields.CharField(max_length=20)
@@ -67,7 +81,26 @@ async def checkpoint_db(x):
         await db.execute("PRAGMA wal_checkpoint(FULL);")
         await db.commit()
 
+# generate_schemas 不会为已有表补充新字段，这里手动补齐
+NEW_COLUMNS = [
+    (User, "GP_balance", "INT NOT NULL DEFAULT 0"),
+    (Client, "push_key", "VARCHAR(36)"),
+]
+
+
+async def add_missing_columns():
+    conn = Tortoise.get_connection("default")
+    for model, column, ddl in NEW_COLUMNS:
+        table = model._meta.db_table
+        columns = await conn.execute_query_dict(f'PRAGMA table_info("{table}")')
+        if column not in {c["name"] for c in columns}:
+            await conn.execute_script(
+                f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}'
+            )
+
+
 # 初始化数据库
 async def init_db():
     await Tortoise.init(db_url=f"sqlite://{DB_PATH}", modules={"models": [__name__]})
     await Tortoise.generate_schemas()
+    await add_missing_columns()
@@ -12,7 +12,8 @@ from telegram.ext import (
 )
 
 from db.db import Client, User
-from utils.client import add_client, refresh_client_status
+from utils.client import add_client, get_push_key, refresh_client_status
+from utils.node_registry import remove_node, update_node
 from utils.statistics import get_client_statistics, get_usage_statistics
 
 
@@ -152,11 +153,13 @@ async def client_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     client_id = query.data.split("|")[1]
     client = await Client.get(id=client_id).prefetch_related("archive_histories")
     usage_text = await get_usage_statistics(clients=[client])
+    push_key = await get_push_key(client)
 
     text = (
         f"📄 节点信息：\n"
         f"🌐 URL：{client.url}\n"
         f"📡 状态：{client.status}\n"
+        f"🔑 推送凭证：<code>{push_key}</code>\n"
         f"站点: {client.EX}， 免费配额: {'充足' if client.Free == "1" else '不足'}\n"
         f"Ⓖ GP: {client.GP}， Ⓒ Credits: {client.Credits}\n"
         f"💸 允许 GP 消耗：{'是 ✅' if client.enable_GP_cost else '否 ❌'}\n\n"
@@ -205,10 +208,12 @@ async def edit_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif action == "suspend":
         client.status = "停用"
         await client.save()
+        update_node(client)
         text = "⏸️ 节点已停用"
         logger.info(f"{update.effective_user.name} 停用节点 {client.url}")
     elif action == "delete":
         await client.delete()
+        remove_node(client.id)
         text = "🗑 节点已删除"
         logger.info(f"{update.effective_user.name} 删除节点 {client.url}")
 
@@ -241,6 +246,7 @@ async def get_new_url_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     client = await Client.get(id=client_id)
     client.url = url
     await client.save()
+    update_node(client)
 
     await refresh_client_status(client)
     text = (
@@ -15,7 +15,7 @@ from telegram.ext import CallbackQueryHandler, ContextTypes, InlineQueryHandler,
 from tortoise.functions import Count
 
 from db.db import User
-from utils.GP_action import checkin, GPRecord
+from utils.GP_action import add_GP, checkin
 from utils.resolve import get_gallery_info
 from utils.preview import preview_add, task_list
 
@@ -126,13 +126,11 @@ async def result_pre(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _, gid, token, require_GP = result.result_id.split("_")
     
     if inline_message_id:
-        user = await User.get_or_none(id=user.id).prefetch_related(
-            "GP_records"
-        )
+        user = await User.get_or_none(id=user.id)
 
         if not user:
             user, created = await User.create(id=user.id, name=user.full_name)
-            await GPRecord.create(user=user, amount=20000)
+            await add_GP(user, 20000)
 
         if user.group == "黑名单":
             mes = "🚫 您已被封禁"
@@ -168,10 +166,8 @@ async def handle_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     await query.answer()
 
-    user = (
-        await User.annotate(history_count=Count("archive_histories"))
-        .prefetch_related("GP_records")
-        .get_or_none(id=user_id)
+    user = await User.annotate(history_count=Count("archive_histories")).get_or_none(
+        id=user_id
     )
     if not user:
         keyboard = [
@@ -6,7 +6,7 @@ from telegram.ext import CallbackQueryHandler, ContextTypes, MessageHandler, fil
 
 from config.config import cfg
 from db.db import User
-from utils.GP_action import deduct_GP, get_current_GP
+from utils.GP_action import get_current_GP, refund_GP, reserve_GP
 from utils.resolve import get_download_url, get_gallery_info
 from utils.preview import preview_add, task_list
 
@@ -87,9 +87,7 @@ async def resolve_gallery(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def download(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    user = await User.get_or_none(id=update.effective_user.id).prefetch_related(
-        "GP_records"
-    )
+    user = await User.get_or_none(id=update.effective_user.id)
 
     if not user:
         await update.effective_message.reply_text("📌 请先使用 /start 注册")
@@ -101,28 +99,35 @@ async def download(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     _, gid, token, image_quality, require_GP, timeout = query.data.split("|")
 
-    current_GP = get_current_GP(user)
-    if current_GP < int(require_GP):
-        await update.effective_message.reply_text(f"⚠️ GP 不足，当前余额：{current_GP}")
+    # 请求节点前预扣 GP，未获得链接时退还
+    reserved = await reserve_GP(user, int(require_GP))
+    if reserved is None:
+        await update.effective_message.reply_text(
+            f"⚠️ GP 不足，当前余额：{get_current_GP(user)}"
+        )
         return
 
-    caption = re.sub(
-        r"\n\n❌ 下载链接获取失败，请稍后再试$",
-        "",
-        update.effective_message.caption,
-    )
-    await update.effective_message.edit_caption(
-        caption=f"<blockquote expandable>{html.escape(caption)}</blockquote>\n\n⏳ 正在获取下载链接，请稍等...",
-        reply_markup=update.effective_message.reply_markup,
-        parse_mode="HTML",
-    )
-    logger.info(f"获取 https://e-hentai.org/g/{gid}/{token}/ 下载链接")
+    d_url = None
+    try:
+        caption = re.sub(
+            r"\n\n❌ 下载链接获取失败，请稍后再试$",
+            "",
+            update.effective_message.caption,
+        )
+        await update.effective_message.edit_caption(
+            caption=f"<blockquote expandable>{html.escape(caption)}</blockquote>\n\n⏳ 正在获取下载链接，请稍等...",
+            reply_markup=update.effective_message.reply_markup,
+            parse_mode="HTML",
+        )
+        logger.info(f"获取 https://e-hentai.org/g/{gid}/{token}/ 下载链接")
 
-    d_url = await get_download_url(
-        user, gid, token, image_quality, int(require_GP), timeout
-    )
+        d_url = await get_download_url(
+            user, gid, token, image_quality, int(require_GP), timeout
+        )
+    finally:
+        if not d_url:
+            await refund_GP(user, reserved)
     if d_url:
-        await deduct_GP(user, int(require_GP))
         keyboard = [
                 [
                     InlineKeyboardButton(
@@ -163,9 +168,7 @@ async def download(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    user = await User.get_or_none(id=update.effective_user.id).prefetch_related(
-        "GP_records"
-    )
+    user = await User.get_or_none(id=update.effective_user.id)
 
     if not user:
         await update.effective_message.reply_text("📌 请先使用 /start 注册")
@@ -4,7 +4,9 @@ from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes
 from config.config import cfg
 from utils.statistics import (
     get_archive_history_file,
+    get_cache_statistics,
     get_client_statistics,
+    get_routing_statistics,
     get_usage_statistics,
     get_user_list_file,
 )
@@ -29,6 +31,15 @@ async def statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text(
             text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="HTML"
         )
+        # 节点 URL 仅对管理员私聊展示，单独发送避免统计消息超长
+        if (
+            update.effective_user.id in cfg["admin"]
+            and update.effective_chat.type == "private"
+        ):
+            await update.effective_message.reply_text(
+                f"{get_cache_statistics()}\n{await get_routing_statistics()}",
+                parse_mode="HTML",
+            )
     else:
         await update.effective_message.reply_text(status_str, parse_mode="HTML")
 
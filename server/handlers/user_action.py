@@ -8,7 +8,8 @@ from tortoise.exceptions import IntegrityError
 
 from db.db import User
 from handlers.resolver import reply_gallery_info
-from utils.GP_action import checkin, get_current_GP, GPRecord
+from utils.GP_action import add_GP, checkin, get_current_GP
+from utils.user_cache import invalidate_user
 from config.config import cfg
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -39,7 +40,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if created:
         await update.effective_message.reply_text("🎉 欢迎加入，您已成功注册！")
         logger.info(f"{user.name}（{user.id}）注册成功")
-        await GPRecord.create(user=user, amount=20000)
+        await add_GP(user, 20000)
     if context.args:
         gid, token = context.args[0].split("_")
         await reply_gallery_info(
@@ -51,9 +52,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def handle_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """处理每日签到命令"""
-    user = await User.get_or_none(
-        id=update.effective_message.from_user.id
-    ).prefetch_related("GP_records")
+    user = await User.get_or_none(id=update.effective_message.from_user.id)
     if not user:
         await update.effective_message.reply_text(
             "请先私聊本 Bot 以注册"
@@ -77,10 +76,8 @@ async def handle_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def myinfo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """查看我的账户信息"""
-    user = (
-        await User.annotate(history_count=Count("archive_histories"))
-        .prefetch_related("GP_records")
-        .get_or_none(id=update.effective_message.from_user.id)
+    user = await User.annotate(history_count=Count("archive_histories")).get_or_none(
+        id=update.effective_message.from_user.id
     )
     if not user:
         await update.effective_message.reply_text(
@@ -113,6 +110,8 @@ async def reset_apikey(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = await User.get(id=user_id)
     user.apikey = uuid.uuid4()
     await user.save()
+    # 保存后再失效，避免并发校验在保存前用旧 Key 重新写入缓存
+    invalidate_user(user.id)
 
     await query.edit_message_text(
         f"重置成功\nAPI Key：`{user.apikey}`", parse_mode="MarkdownV2"
@@ -13,18 +13,17 @@ from telegram.ext import (
 from tortoise.functions import Count
 
 from config.config import cfg
-from db.db import GPRecord, User
-from utils.GP_action import get_current_GP
+from db.db import User
+from utils.GP_action import add_GP, get_current_GP, reset_GP
+from utils.user_cache import invalidate_user
 
 
 async def get_user_by_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.effective_message
     if message.reply_to_message:
-        user = (
-            await User.annotate(history_count=Count("archive_histories"))
-            .prefetch_related("GP_records")
-            .get_or_none(id=message.reply_to_message.from_user.id)
-        )
+        user = await User.annotate(
+            history_count=Count("archive_histories")
+        ).get_or_none(id=message.reply_to_message.from_user.id)
         if user:
             markup, text = usermgr_text(user)
             await context.bot.send_message(
@@ -51,9 +50,7 @@ async def start_usermgr(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_user_id_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """接收用户 ID 或转发的消息并展示操作选项"""
     message = update.effective_message
-    queryset = User.annotate(history_count=Count("archive_histories")).prefetch_related(
-        "GP_records"
-    )
+    queryset = User.annotate(history_count=Count("archive_histories"))
     user = None
     if message.forward_origin:
         forward_origin = message.forward_origin
@@ -125,18 +122,17 @@ async def handle_GP_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return 0
 
     user_id = context.user_data.get("user_id")
-    user = await User.get(id=user_id).prefetch_related("GP_records")
-    original_balance = get_current_GP(user)
+    user = await User.get(id=user_id)
 
-    await GPRecord.create(
-        user=user,
-        amount=amount,
+    await add_GP(
+        user,
+        amount,
         source="管理员发放",
         expire_time=datetime.datetime.max,
     )
 
     await update.effective_message.reply_text(
-        f"为用户 {user.name} 添加了 {amount} GP\n当前剩余：{original_balance + amount} GP"
+        f"为用户 {user.name} 添加了 {amount} GP\n当前剩余：{get_current_GP(user)} GP"
     )
     logger.info(
         f"管理员 {update.effective_user.name} 为用户 {user.name} 添加 {amount} GP"
@@ -152,7 +148,7 @@ async def handle_reset_GP(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["user_id"] = user_id
 
     user = await User.get(id=user_id)
-    await user.GP_records.all().delete()
+    await reset_GP(user)
 
     await query.edit_message_text(f"用户 {user.name} GP 已清空")
     logger.info(f"管理员 {update.effective_user.name} 清空用户 {user.name} GP")
@@ -196,6 +192,7 @@ async def handle_group_change(update: Update, context: ContextTypes.DEFAULT_TYPE
     user = await User.get(id=user_id)
     user.group = group
     await user.save()
+    invalidate_user(user.id)
 
     await query.edit_message_text(f"用户 {user.name} 已切换至【{group}】用户组")
     logger.info(
@@ -8,8 +8,14 @@ from config.config import cfg
 from db.db import init_db, checkpoint_db
 from handlers import BOT_COMMANDS, register_all_handlers
 from utils.api import clean_results_cache
-from utils.client import refresh_all_clients
-from utils.GP_action import clean_GP_records
+from utils.client import (
+    check_client_heartbeats,
+    probe_open_clients,
+    refresh_all_clients,
+)
+from utils.gallery_cache import clean_gallery_cache
+from utils.GP_action import check_GP_balance, clean_GP_records, expire_GP_records
+from utils.node_registry import load_registry
 from utils.resolve import fetch_tag_map
 from utils.preview import preview_start
 
@@ -17,6 +23,8 @@ logger.add("log.log", encoding="utf-8")
 
 async def post_init(app):
     await init_db()
+    await load_registry()
+    await check_GP_balance(None)
     await app.bot.set_my_commands(BOT_COMMANDS)
     asyncio.create_task(preview_start())
 
@@ -32,9 +40,15 @@ telegram_app = (
 
 register_all_handlers(telegram_app)
 telegram_app.job_queue.run_repeating(fetch_tag_map, interval=86400, first=5)
-telegram_app.job_queue.run_repeating(refresh_all_clients, interval=3600, first=10)
-telegram_app.job_queue.run_repeating(clean_results_cache, interval=86400)
+telegram_app.job_queue.run_repeating(
+    refresh_all_clients, interval=cfg.get("client_refresh_interval", 3600), first=10
+)
+telegram_app.job_queue.run_repeating(check_client_heartbeats, interval=60)
+telegram_app.job_queue.run_repeating(probe_open_clients, interval=cfg.get("breaker_probe_interval", 5))
+telegram_app.job_queue.run_repeating(clean_results_cache, interval=3600)
 telegram_app.job_queue.run_repeating(clean_GP_records, interval=86400)
+telegram_app.job_queue.run_repeating(expire_GP_records, interval=300)
+telegram_app.job_queue.run_repeating(clean_gallery_cache, interval=3600)
 telegram_app.job_queue.run_repeating(checkpoint_db, interval=300)
 
 # 启动 FastAPI 的线程
@@ -1,29 +1,53 @@
 import random
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
 from loguru import logger
-from tortoise.expressions import Q
+from tortoise.expressions import F, Q
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
 
 from db.db import GPRecord, User
+from utils.user_cache import invalidate_user
 
 
 # 获取用户当前有效 GP 总额
 def get_current_GP(user: User) -> int:
-    now = datetime.now(tz=timezone.utc)
-    return sum(
-        r.amount for r in user.GP_records if r.expire_time > now and r.amount > 0
-    )
+    return user.GP_balance
 
 
-async def checkin(user: User):
-    today = datetime.now(ZoneInfo("Asia/Shanghai")).date()
+async def add_GP(user: User, amount: int, **kwargs) -> GPRecord:
+    """发放 GP：写入记录并同步更新余额"""
+    async with in_transaction() as conn:
+        record = await GPRecord.create(user=user, amount=amount, using_db=conn, **kwargs)
+        await User.filter(id=user.id).using_db(conn).update(
+            GP_balance=F("GP_balance") + amount
+        )
+    user.GP_balance += amount
+    invalidate_user(user.id)
+    return record
+
 
-    already_checked = any(
-        record.source == "签到"
-        and record.expire_time.astimezone(ZoneInfo("Asia/Shanghai")).date()
-        == today + timedelta(days=7)
-        for record in user.GP_records
+async def reset_GP(user: User):
+    """清空用户 GP"""
+    async with in_transaction() as conn:
+        await GPRecord.filter(user_id=user.id).using_db(conn).delete()
+        await User.filter(id=user.id).using_db(conn).update(GP_balance=0)
+    user.GP_balance = 0
+    invalidate_user(user.id)
+
+
+async def checkin(user: User):
+    # 签到记录有效期 7 天，过期日期为今天 + 7 天即说明今天已签到
+    expire_day = datetime.now(ZoneInfo("Asia/Shanghai")).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) + timedelta(days=7)
+    already_checked = await GPRecord.exists(
+        user_id=user.id,
+        source="签到",
+        expire_time__gte=expire_day,
+        expire_time__lt=expire_day + timedelta(days=1),
     )
 
     original_balance = get_current_GP(user)
@@ -31,31 +55,173 @@ async def checkin(user: User):
         return 0, original_balance
 
     amount = random.randint(10000, 20000)
-    await GPRecord.create(user=user, amount=amount)
+    await add_GP(user, amount)
     logger.info(f"{user.name}（{user.id}）签到成功，获得 {amount} GP")
 
     return amount, original_balance + amount
 
 
-# 扣除 GP
-async def deduct_GP(user: User, amount: int):
-    now = datetime.now()
-    valid_GP = (
-        await user.GP_records.filter(expire_time__gt=now, amount__gt=0)
-        .order_by("expire_time")
-        .all()
+class _RecordsShort(Exception):
+    """有效记录不足以覆盖扣除额，用于回滚扣除事务"""
+
+
+async def _expire_user_records(user_id: int, now: datetime, conn) -> None:
+    """在事务内将该用户已过期但尚未清理的记录从余额中扣除并删除"""
+    expired = await GPRecord.filter(
+        user_id=user_id, expire_time__lte=now, amount__gt=0
+    ).using_db(conn)
+    if not expired:
+        return
+    await User.filter(id=user_id).using_db(conn).update(
+        GP_balance=F("GP_balance") - sum(r.amount for r in expired)
     )
+    await GPRecord.filter(id__in=[r.id for r in expired]).using_db(conn).delete()
+
+
+# 扣除 GP，余额不足时不扣除并返回 False
+async def deduct_GP(user: User, amount: int) -> bool:
+    return await reserve_GP(user, amount) is not None
+
+
+async def reserve_GP(user: User, amount: int) -> list[tuple] | None:
+    """扣除 GP，返回被扣除的 (记录 id, 扣除额, 过期时间) 列表，供 refund_GP 原样退还
+
+    余额不足时不扣除并返回 None
+    """
+    if amount <= 0:
+        return []
+
+    now = datetime.now(tz=timezone.utc)
+    try:
+        async with in_transaction() as conn:
+            # 先结清过期记录，保证余额与参与扣除的记录一致
+            await _expire_user_records(user.id, now, conn)
+            # 余额校验与扣减在同一条 UPDATE 中完成，并发扣除不会透支
+            updated = await User.filter(id=user.id, GP_balance__gte=amount).using_db(
+                conn
+            ).update(GP_balance=F("GP_balance") - amount)
+            if not updated:
+                user.GP_balance = (
+                    await User.filter(id=user.id).using_db(conn).first()
+                ).GP_balance
+                return None
 
-    total_deducted = 0
-    for record in valid_GP:
-        if total_deducted >= amount:
-            break
-        deduct_amount = min(record.amount, amount - total_deducted)
-        record.amount -= deduct_amount
-        total_deducted += deduct_amount
-        await record.save()
+            # 按过期时间先后扣除记录，一次批量 UPDATE 写回
+            valid_GP = (
+                await GPRecord.filter(
+                    user_id=user.id, expire_time__gt=now, amount__gt=0
+                )
+                .using_db(conn)
+                .order_by("expire_time", "id")
+            )
+            remaining = amount
+            changed = []
+            debited = []
+            for record in valid_GP:
+                if remaining <= 0:
+                    break
+                deduct_amount = min(record.amount, remaining)
+                record.amount -= deduct_amount
+                remaining -= deduct_amount
+                changed.append(record)
+                debited.append((record.id, deduct_amount, record.expire_time))
+            # 余额与记录不一致，回滚整个扣除，由 check_GP_balance 修正余额
+            if remaining > 0:
+                raise _RecordsShort
+            if changed:
+                await GPRecord.bulk_update(changed, fields=["amount"], using_db=conn)
+    except _RecordsShort:
+        logger.error(f"{user.name}（{user.id}）GP 记录不足以扣除 {amount}，已回滚")
+        user.GP_balance = (await User.get(id=user.id)).GP_balance
+        invalidate_user(user.id)
+        return None
+
+    user.GP_balance = (await User.get(id=user.id)).GP_balance
+    invalidate_user(user.id)
+    return debited
+
+
+async def refund_GP(user: User, debited: list[tuple]) -> None:
+    """将 reserve_GP 扣除的 GP 退回原记录，保留原过期时间
+
+    原记录已被清理时按原过期时间补建记录，已过期的部分不再退还
+    """
+    now = datetime.now(tz=timezone.utc)
+    refunded = 0
+    async with in_transaction() as conn:
+        for record_id, amount, expire_time in debited:
+            if await GPRecord.filter(id=record_id).using_db(conn).update(
+                amount=F("amount") + amount
+            ):
+                refunded += amount
+            elif expire_time > now:
+                await GPRecord.create(
+                    user=user,
+                    amount=amount,
+                    expire_time=expire_time,
+                    source="退还",
+                    using_db=conn,
+                )
+                refunded += amount
+        if refunded:
+            await User.filter(id=user.id).using_db(conn).update(
+                GP_balance=F("GP_balance") + refunded
+            )
+    if refunded:
+        user.GP_balance += refunded
+        invalidate_user(user.id)
+        logger.info(f"{user.name}（{user.id}）退还 {refunded} GP")
+
+
+async def expire_GP_records(_):
+    """将已过期记录的 GP 从余额中扣除"""
+    now = datetime.now(tz=timezone.utc)
+    expired_by_user = defaultdict(int)
+    async with in_transaction() as conn:
+        expired = await GPRecord.filter(expire_time__lte=now, amount__gt=0).using_db(
+            conn
+        )
+        for record in expired:
+            expired_by_user[record.user_id] += record.amount
+        for user_id, amount in expired_by_user.items():
+            await User.filter(id=user_id).using_db(conn).update(
+                GP_balance=F("GP_balance") - amount
+            )
+        await GPRecord.filter(id__in=[r.id for r in expired]).using_db(conn).delete()
+
+    for user_id in expired_by_user:
+        invalidate_user(user_id)
+
+
+async def check_GP_balance(_):
+    """校验余额与有效 GP 记录是否一致，不一致时以记录为准修正"""
+    await expire_GP_records(_)
+    now = datetime.now(tz=timezone.utc)
+    fixed = []
+    async with in_transaction() as conn:
+        totals = {
+            row["user_id"]: row["total"]
+            for row in await GPRecord.filter(expire_time__gt=now, amount__gt=0)
+            .using_db(conn)
+            .group_by("user_id")
+            .annotate(total=Sum("amount"))
+            .values("user_id", "total")
+        }
+
+        for user in await User.all().using_db(conn):
+            expected = totals.get(user.id) or 0
+            if user.GP_balance != expected:
+                logger.warning(
+                    f"{user.name}（{user.id}）GP 余额不一致：{user.GP_balance} -> {expected}"
+                )
+                await User.filter(id=user.id).using_db(conn).update(GP_balance=expected)
+                fixed.append(user.id)
+
+    for user_id in fixed:
+        invalidate_user(user_id)
 
 
 async def clean_GP_records(_):
-    now = datetime.now()
+    await check_GP_balance(_)
+    now = datetime.now(tz=timezone.utc)
     await GPRecord.filter(Q(expire_time__lte=now) | Q(amount__lte=0)).delete()
@@ -1,33 +1,60 @@
 import asyncio
-import time
-from collections import defaultdict
+import ipaddress
+import json
 import traceback
+import uuid
+from urllib.parse import urlsplit
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, RedirectResponse
-
-from db.db import User
-from utils.ehentai import get_GP_cost
-from utils.GP_action import checkin, deduct_GP, get_current_GP
-from utils.resolve import get_download_url, get_gallery_info
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from loguru import logger
+
+from config.config import cfg
+from db.db import ArchiveHistory, Client
+from utils.gallery_cache import (
+    get_cached_GP_cost,
+    invalidate_gallery_cache,
+    peek_GP_cost,
+)
+from utils.GP_action import (
+    checkin,
+    deduct_GP,
+    get_current_GP,
+    refund_GP,
+    reserve_GP,
+)
+from utils.client import handle_client_push
+from utils.http_client import http
+from utils.resolve import get_gallery_info, request_download_url
+from utils.ttl_cache import TTLCache
+from utils.user_cache import get_user_by_apikey
+
+# 归档链接有效期
+ARCHIVE_URL_TTL = cfg.get("archive_url_ttl", 86400)
+# 是否在用户之间共享归档链接
+SHARED_ARCHIVE = cfg.get("shared_archive", False)
+# 批量解析单次最多画廊数 / 单个请求同时解析数
+BATCH_MAX_ITEMS = cfg.get("batch_max_items", 100)
+BATCH_CONCURRENCY = cfg.get("batch_concurrency", 4)
 
 processing_tasks = {}
-results_cache = defaultdict(dict)
+# key 为 user.id|gid|image_quality
+results_cache = TTLCache(cfg.get("results_cache_size", 10000), ARCHIVE_URL_TTL)
+# 跨用户共享的归档链接，key 为 gid|image_quality
+shared_archive_cache = TTLCache(cfg.get("results_cache_size", 10000), ARCHIVE_URL_TTL)
+# 异步解析任务，key 为 job_id
+jobs = TTLCache(cfg.get("job_cache_size", 10000), cfg.get("job_ttl", 3600))
+# 持有后台任务引用，避免被垃圾回收
+job_tasks = set()
 lock = asyncio.Lock()
 
 app = FastAPI()
 
 
 async def clean_results_cache(_):
-    now = time.time()
-    keys_to_delete = []
-
-    for key, value in results_cache.items():
-        if not value or value.get("expire_time", 0) < now:
-            keys_to_delete.append(key)
-
-    for key in keys_to_delete:
-        results_cache.pop(key, None)
+    results_cache.expire()
+    shared_archive_cache.expire()
+    jobs.expire()
 
 
 def format_response(code: int, msg: str, data: dict = None):
@@ -46,7 +73,7 @@ async def verify_user(apikey: str):
     if not apikey:
         return format_response(1, "参数不完整")
 
-    user = await User.get_or_none(apikey=apikey).prefetch_related("GP_records")
+    user = await get_user_by_apikey(apikey)
     if not user:
         return format_response(2, "无效的 API Key")
 
@@ -56,9 +83,9 @@ async def verify_user(apikey: str):
     return user
 
 
-async def process_resolve(user, gid, token, image_quality):
+async def process_resolve(user, gid, token, image_quality, force_resolve=False):
     try:
-        require_GP = await get_GP_cost(gid, token)
+        require_GP = await get_cached_GP_cost(gid, token)
     except Exception:
         return 4, "获取画廊信息失败", None, None
 
@@ -81,16 +108,95 @@ async def process_resolve(user, gid, token, image_quality):
     if get_current_GP(user) < int(selected_cost):
         return 5, "GP 不足", None, selected_cost
 
-    # 获取下载链接
-    _, _, _, _, timeout = await get_gallery_info(gid, token)
-    d_url = await get_download_url(user, gid, token, image_quality, int(selected_cost), timeout)
+    # 其他用户近期已解析过同一画廊时直接复用链接，仍正常扣除 GP 并记录
+    shared_key = f"{gid}|{image_quality}"
+    shared = shared_archive_cache.get(shared_key) if SHARED_ARCHIVE else None
+    if shared and not force_resolve:
+        if not await deduct_GP(user, int(selected_cost)):
+            return 5, "GP 不足", None, selected_cost
+        await ArchiveHistory.create(
+            user=user,
+            gid=gid,
+            token=token,
+            GP_cost=0,  # 未消耗节点 GP
+            client=await Client.get_or_none(id=shared["client_id"]),
+        )
+        return 0, "解析成功", shared["d_url"], selected_cost
+
+    # 请求节点前预扣 GP，未获得链接时退还，避免节点已归档但用户扣除失败
+    reserved = await reserve_GP(user, int(selected_cost))
+    if reserved is None:
+        return 5, "GP 不足", None, selected_cost
+    d_url = None
+    try:
+        _, _, _, _, timeout = await get_gallery_info(gid, token)
+        d_url, client = await request_download_url(
+            user, gid, token, image_quality, int(selected_cost), timeout
+        )
+    finally:
+        if not d_url:
+            await refund_GP(user, reserved)
     if d_url:
         d_url = d_url + "0?start=1" if image_quality == "org" else d_url + "1?start=1"
-        await deduct_GP(user, int(selected_cost))
+        if SHARED_ARCHIVE:
+            shared_archive_cache.set(
+                shared_key, {"d_url": d_url, "client_id": client.id}
+            )
         return 0, "解析成功", d_url, selected_cost
     return 6, "解析失败", None, selected_cost
 
 
+async def resolve_with_cache(user, gid, token, image_quality, force_resolve=False):
+    """带结果缓存与并发去重的解析，返回 (code, msg, data)"""
+    if force_resolve:
+        await invalidate_gallery_cache(gid, token, GP_cost_only=True)
+
+    # 缓存 key 包含清洗度，避免不同质量串用
+    key = f"{user.id}|{gid}|{image_quality}"
+
+    cached_url = results_cache.get(key)
+    if cached_url and not force_resolve:
+        return (
+            0,
+            "使用缓存记录",
+            {"archive_url": cached_url, "image_quality": image_quality},
+        )
+
+    task = processing_tasks.get(key)
+    if not task:
+        async with lock:
+            task = processing_tasks.get(key)
+            if not task:
+                task = asyncio.create_task(
+                    _resolve_task(key, user, gid, token, image_quality, force_resolve)
+                )
+                processing_tasks[key] = task
+                task.add_done_callback(lambda _: processing_tasks.pop(key, None))
+
+    # shield：请求方断开连接时不取消共享的解析任务
+    code, msg, d_url, gp_cost = await asyncio.shield(task)
+    if not d_url:
+        return code, msg, {"image_quality": image_quality, "gp_cost": gp_cost}
+
+    return (
+        code,
+        msg,
+        {
+            "archive_url": d_url,
+            "image_quality": image_quality,
+            "gp_cost": gp_cost,
+        },
+    )
+
+
+async def _resolve_task(key, user, gid, token, image_quality, force_resolve):
+    result = await process_resolve(user, gid, token, image_quality, force_resolve)
+    # 在任务内写入缓存，避免任务结束到写入缓存之间重复解析
+    if result[2]:
+        results_cache.set(key, result[2])
+    return result
+
+
 @app.post("/resolve")
 async def handle_resolve(request: Request):
     try:
@@ -100,56 +206,195 @@ async def handle_resolve(request: Request):
         token = data.get("token")
         image_quality = data.get("image_quality", "org")  # 可选参数
         force_resolve = data.get("force_resolve", False)
+        async_mode = data.get("async", False)
+        callback_url = data.get("callback_url")
         if not all([apikey, gid, token]):
             return format_response(1, "参数不完整")
+        if callback_url and not await is_public_url(callback_url):
+            return format_response(14, "参数 callback_url 非法")
 
         user = await verify_user(apikey)
         if isinstance(user, JSONResponse):
             return user
 
-        # 缓存 key 包含清洗度，避免不同质量串用
-        key = f"{user.id}|{gid}|{image_quality}"
-
-        cache = results_cache.get(key)
-        if cache and cache.get("expire_time", 0) > time.time() and not force_resolve:
+        if async_mode:
+            job_id = uuid.uuid4().hex
+            jobs.set(job_id, {"user_id": user.id, "status": "pending"})
+            task = asyncio.create_task(
+                run_job(
+                    job_id, user, gid, token, image_quality, force_resolve, callback_url
+                )
+            )
+            job_tasks.add(task)
+            task.add_done_callback(job_tasks.discard)
             return format_response(
-                0,
-                "使用缓存记录",
-                {"archive_url": cache["d_url"], "image_quality": image_quality},
+                0, "任务已提交", {"job_id": job_id, "status": "pending"}
             )
 
-        task = processing_tasks.get(key)
-        if not task:
-            async with lock:
-                task = processing_tasks.get(key)
-                if not task:
-                    task = asyncio.create_task(
-                        process_resolve(user, gid, token, image_quality)
-                    )
-                    processing_tasks[key] = task
+        code, msg, result = await resolve_with_cache(
+            user, gid, token, image_quality, force_resolve
+        )
+        return format_response(code, msg, result)
+
+    except Exception as e:
+        traceback.print_exc()
+        return handle_exception(e)
+
 
+async def is_public_url(url) -> bool:
+    """回调地址须为 http/https，且主机解析到的地址均为公网地址
+
+    避免借回调让服务端请求本机或内网服务（节点、管理后台等）
+    """
+    try:
+        parts = urlsplit(str(url))
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return False
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+        )
+    except (ValueError, OSError):
+        return False
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            return False
+    return bool(infos)
+
+
+async def run_job(job_id, user, gid, token, image_quality, force_resolve, callback_url):
+    """后台执行异步解析任务，完成后写入任务结果并回调"""
+    try:
+        code, msg, result = await resolve_with_cache(
+            user, gid, token, image_quality, force_resolve
+        )
+    except Exception as e:
+        traceback.print_exc()
+        code, msg, result = 99, f"服务器内部错误: {str(e)}", {}
+
+    job = {
+        "user_id": user.id,
+        "status": "done",
+        "code": code,
+        "msg": msg,
+        "data": result,
+    }
+    jobs.set(job_id, job)
+
+    if not callback_url:
+        return
+    payload = {"job_id": job_id, "code": code, "msg": msg, "data": result}
+    for attempt in range(3):
         try:
-            code, msg, d_url, gp_cost = await task
-            if not d_url:
-                return format_response(
-                    code, msg, {"image_quality": image_quality, "gp_cost": gp_cost}
-                )
+            # 发送前重新校验，防止域名在提交后改为解析到内网地址
+            if not await is_public_url(callback_url):
+                logger.warning(f"任务 {job_id} 回调地址 {callback_url} 非公网地址，已放弃")
+                return
+            # 不跟随重定向，避免经跳转访问内网地址
+            resp = await http.post(
+                callback_url, json=payload, timeout=10, follow_redirects=False
+            )
+            if resp.status_code < 500:
+                return
+        except Exception as e:
+            logger.warning(f"任务 {job_id} 回调 {callback_url} 失败：{e}")
+        await asyncio.sleep(2**attempt)
+    logger.error(f"任务 {job_id} 回调 {callback_url} 多次失败，已放弃")
+
+
+@app.post("/jobs/{job_id}")
+async def handle_job(job_id: str, request: Request):
+    try:
+        data = await request.json()
+        user = await verify_user(data.get("apikey"))
+        if isinstance(user, JSONResponse):
+            return user
 
-            results_cache[key] = {"d_url": d_url, "expire_time": time.time() + 86400}
+        job = jobs.get(job_id)
+        if not job or job["user_id"] != user.id:
+            return format_response(13, "任务不存在或已过期")
+        if job["status"] == "pending":
             return format_response(
-                code,
-                msg,
-                {
-                    "archive_url": d_url,
-                    "image_quality": image_quality,
-                    "gp_cost": gp_cost,
-                },
+                12, "任务处理中", {"job_id": job_id, "status": "pending"}
             )
+        return format_response(
+            job["code"], job["msg"], {"job_id": job_id, "status": "done", **job["data"]}
+        )
 
-        finally:
-            async with lock:
-                if processing_tasks.get(key) == task:
-                    del processing_tasks[key]
+    except Exception as e:
+        return handle_exception(e)
+
+
+@app.post("/resolve/batch")
+async def handle_resolve_batch(request: Request):
+    try:
+        data = await request.json()
+        apikey = data.get("apikey")
+        items = data.get("items")
+        force_resolve = data.get("force_resolve", False)
+        if not apikey or not isinstance(items, list) or not items:
+            return format_response(1, "参数不完整")
+        if len(items) > BATCH_MAX_ITEMS:
+            return format_response(11, f"单次最多解析 {BATCH_MAX_ITEMS} 个画廊")
+
+        user = await verify_user(apikey)
+        if isinstance(user, JSONResponse):
+            return user
+
+        # GP 余额一次性校验：只计入内存缓存中已知消耗的画廊，不在此发起查询，
+        # 其余画廊的消耗在解析时受并发上限约束查询，并由逐个预扣 GP 保证不透支
+        total_cost = 0
+        for item in items:
+            if not (isinstance(item, dict) and item.get("gid") and item.get("token")):
+                continue
+            image_quality = item.get("image_quality", "org")
+            if not force_resolve and results_cache.get(
+                f"{user.id}|{item['gid']}|{image_quality}"
+            ):
+                continue
+            if cached := peek_GP_cost(item["gid"], item["token"]):
+                total_cost += int(cached[0].get(image_quality) or 0)
+        if get_current_GP(user) < total_cost:
+            return format_response(
+                5, "GP 不足", {"gp_cost": total_cost, "current_GP": get_current_GP(user)}
+            )
+
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def resolve_item(index, item):
+            if not isinstance(item, dict) or not item.get("gid") or not item.get("token"):
+                return {"index": index, "code": 1, "msg": "参数不完整", "data": {}}
+            gid, token = item["gid"], item["token"]
+            image_quality = item.get("image_quality", "org")
+            async with semaphore:
+                try:
+                    code, msg, result = await resolve_with_cache(
+                        user, gid, token, image_quality, force_resolve
+                    )
+                except Exception as e:
+                    code, msg, result = 99, f"服务器内部错误: {str(e)}", {}
+            return {
+                "index": index,
+                "gid": gid,
+                "token": token,
+                "code": code,
+                "msg": msg,
+                "data": result,
+            }
+
+        async def stream():
+            tasks = [
+                asyncio.create_task(resolve_item(index, item))
+                for index, item in enumerate(items)
+            ]
+            try:
+                for future in asyncio.as_completed(tasks):
+                    yield json.dumps(await future, ensure_ascii=False) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
 
     except Exception as e:
         traceback.print_exc()
@@ -193,6 +438,25 @@ async def checkin_request(request: Request):
         return handle_exception(e)
 
 
+@app.post("/client/heartbeat")
+async def client_heartbeat(request: Request):
+    """节点推送状态"""
+    try:
+        data = await request.json()
+        push_key = data.get("push_key")
+        status = data.get("status")
+        if not push_key or not isinstance(status, dict) or "msg" not in status:
+            return format_response(1, "参数不完整")
+
+        client = await handle_client_push(str(push_key), status)
+        if not client:
+            return format_response(15, "无效的推送凭证")
+        return format_response(0, "推送成功", {"status": client.status})
+
+    except Exception as e:
+        return handle_exception(e)
+
+
 @app.get("/")
 async def redirect():
     return RedirectResponse(url="https://t.me/EH_ArBot", status_code=301)
@@ -0,0 +1,63 @@
+"""archiver.php 页面解析
+
+server/utils/archiver.py 与 client/utils/archiver.py 内容相同，修改时需同步。
+
+页面结构固定，只需要其中几个 <strong> 与 <p> 的文本，用正则直接提取，
+不构建完整的 DOM 树：
+- <strong> 依次为：原图消耗、原图大小、重采样消耗、重采样大小
+- 左侧 div 中的第一个 <strong> 为原图消耗，"Free!" 表示仍有免费配额
+- 第二个 <p> 为 GP / Credits 余额
+"""
+
+import re
+from html import unescape
+from itertools import islice
+
+STRONG_RE = re.compile(r"<strong[^>]*>(.*?)</strong>", re.DOTALL | re.IGNORECASE)
+LEFT_DIV_RE = re.compile(
+    r"<div[^>]*style=\"[^\"]*left[^\"]*\"[^>]*>.*?<strong[^>]*>(.*?)</strong>",
+    re.DOTALL | re.IGNORECASE,
+)
+P_RE = re.compile(r"<p\b[^>]*>(.*?)</p>", re.DOTALL | re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]+>")
+NON_ALNUM_RE = re.compile(r"[^a-zA-Z0-9]")
+
+
+def _text(fragment: str) -> str:
+    return unescape(TAG_RE.sub("", fragment)).strip()
+
+
+def archiver_strongs(html: str) -> list[str]:
+    """按顺序返回页面中所有 <strong> 的文本"""
+    return [_text(s) for s in STRONG_RE.findall(html)]
+
+
+def cost_to_GP(cost: str) -> int | str:
+    """将消耗文本转换为 GP，"Free!" 为 0，否则提取其中的数字"""
+    if cost == "Free!":
+        return 0
+    return "".join(ch for ch in cost if ch.isdigit())
+
+
+def parse_free(html: str) -> int | None:
+    """是否仍有免费配额：1 有，0 无，None 无法判断"""
+    match = LEFT_DIV_RE.search(html)
+    if not match:
+        return None
+    return 1 if _text(match.group(1)) == "Free!" else 0
+
+
+def parse_balance(html: str) -> tuple[str, str] | None:
+    """解析 GP / Credits 余额"""
+    paragraphs = [m.group(1) for m in islice(P_RE.finditer(html), 2)]
+    if len(paragraphs) < 2:
+        return None
+    G_and_C = NON_ALNUM_RE.sub("", _text(paragraphs[1])).split("GP")
+    if len(G_and_C) != 2:
+        return None
+    return G_and_C[0], G_and_C[1].replace("Credits", "")
+
+
+def is_login_bounce(url, html: str) -> bool:
+    """cookie 失效时会被跳转到登录页"""
+    return "bounce_login.php" in str(url) or "bounce_login.php" in html[:2048]
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from loguru import logger
+
+from config.config import cfg
+
+# 连续失败该次数后熔断节点，不再分配解析请求
+FAILURE_THRESHOLD = cfg.get("breaker_failure_threshold", 2)
+# 熔断后等待多久(秒)进行半开探测，探测失败时翻倍，直到上限
+BASE_COOLDOWN = cfg.get("breaker_cooldown", 10)
+MAX_COOLDOWN = cfg.get("breaker_max_cooldown", 600)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = BASE_COOLDOWN
+        self.opened_at = 0.0
+
+
+# 节点 URL -> CircuitBreaker，bot 与 API 在不同线程中更新
+breakers = {}
+_lock = threading.Lock()
+
+
+def record_success(url: str) -> None:
+    """节点正常响应，关闭熔断"""
+    with _lock:
+        breaker = breakers.get(url)
+        if not breaker:
+            return
+        if breaker.state != CLOSED:
+            logger.info(f"节点 {url} 已恢复，解除熔断")
+        breakers.pop(url)
+
+
+def record_failure(url: str) -> None:
+    """节点请求失败：达到阈值时熔断，半开探测失败时加倍冷却时间"""
+    with _lock:
+        breaker = breakers.setdefault(url, CircuitBreaker())
+        if breaker.state == HALF_OPEN:
+            breaker.cooldown = min(breaker.cooldown * 2, MAX_COOLDOWN)
+        elif breaker.state == CLOSED:
+            breaker.failures += 1
+            if breaker.failures < FAILURE_THRESHOLD:
+                return
+        _open(url, breaker)
+
+
+def trip(url: str) -> None:
+    """立即熔断节点（如定时刷新状态失败），由半开探测负责恢复"""
+    with _lock:
+        breaker = breakers.setdefault(url, CircuitBreaker())
+        if breaker.state == CLOSED:
+            _open(url, breaker)
+
+
+def _open(url: str, breaker: CircuitBreaker) -> None:
+    breaker.state = OPEN
+    breaker.opened_at = time.time()
+    logger.warning(f"节点 {url} 熔断，{breaker.cooldown} 秒后探测")
+
+
+def is_open(url: str) -> bool:
+    """节点是否处于熔断中（含半开探测），熔断中的节点不参与调度"""
+    breaker = breakers.get(url)
+    return breaker is not None and breaker.state != CLOSED
+
+
+def due_probes() -> list[str]:
+    """冷却结束的节点转为半开状态，返回需要探测的节点 URL"""
+    now = time.time()
+    urls = []
+    with _lock:
+        for url, breaker in breakers.items():
+            if breaker.state == OPEN and now - breaker.opened_at >= breaker.cooldown:
+                breaker.state = HALF_OPEN
+                urls.append(url)
+    return urls
+
+
+def forget(url: str) -> None:
+    """节点已删除或停用，丢弃其熔断状态"""
+    with _lock:
+        breakers.pop(url, None)
+
+
+def get_breaker_state(url: str) -> dict | None:
+    """节点的熔断状态，未熔断时返回 None"""
+    breaker = breakers.get(url)
+    if not breaker or breaker.state == CLOSED:
+        return None
+    return {
+        "state": breaker.state,
+        "cooldown": breaker.cooldown,
+        "remaining": max(breaker.opened_at + breaker.cooldown - time.time(), 0),
+    }
@@ -1,12 +1,66 @@
 import asyncio
 import random
+import time
 from urllib.parse import urljoin
+from uuid import uuid4
 
 from loguru import logger
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from config.config import cfg
 from db.db import Client, User
+from utils.breaker import (
+    due_probes,
+    forget,
+    is_open,
+    record_failure,
+    record_success,
+    trip,
+)
 from utils.http_client import http
+from utils.node_registry import find_candidates, get_nodes, nodes, update_node
+from utils.scheduler import rank_clients
+
+# 超过该时长(秒)未收到推送的节点改为主动拉取状态
+HEARTBEAT_TIMEOUT = cfg.get("client_heartbeat_timeout", 180)
+# 节点 id -> 最近一次推送状态的时间
+last_push = {}
+STATUS_FIELDS = ("status", "enable_GP_cost", "EX", "Free", "GP", "Credits")
+# 定时刷新周期(秒)，各节点在周期内随机错开刷新，同时刷新的节点数有上限
+REFRESH_INTERVAL = cfg.get("client_refresh_interval", 3600)
+REFRESH_CONCURRENCY = cfg.get("client_refresh_concurrency", 5)
+# 节点 id -> 最近一次由解析响应确认状态的时间
+last_resolve = {}
+
+
+# 节点 URL -> 节点上报的归档队列状态，调度时折算排队等待
+client_queues = {}
+
+
+def status_fields(client: Client) -> dict:
+    return {field: getattr(client, field) for field in STATUS_FIELDS}
+
+
+def changed_fields(client: Client, before: dict) -> dict:
+    """相比 before 实际变化的状态字段，按数据库中存储的字符串比较"""
+    return {
+        field: value
+        for field, value in status_fields(client).items()
+        if str(value) != str(before[field])
+    }
+
+
+async def save_client_status(client: Client, before: dict) -> None:
+    """只写入变化的状态字段，无变化时不写数据库"""
+    if changed := changed_fields(client, before):
+        await client.save(update_fields=list(changed))
+        update_node(client)
+
+
+def record_client_queue(url: str, status: dict) -> None:
+    """记录节点状态中的队列信息（旧版节点不上报）"""
+    if queue := status.get("queue"):
+        client_queues[url] = queue
 
 
 async def fetch_status(url: str) -> tuple[dict | None, bool | None]:
@@ -14,48 +68,61 @@ async def fetch_status(url: str) -> tuple[dict | None, bool | None]:
     try:
         resp = await http.get(urljoin(url, "/status"), timeout=15)
         data = resp.json()
+        record_client_queue(url, data["status"])
         return data["status"]["msg"], data["status"]["enable_GP_cost"]
     except Exception as e:
         logger.error(f"获取节点 {url} 状态失败：{e}")
         return None, None
 
 
+def apply_client_status(
+    client: Client, status_data: dict | None, enable_GP_cost: bool | None
+) -> bool:
+    """根据节点上报的状态更新 client，返回是否需要提醒节点提供者"""
+    if status_data is None:
+        client.status = "网络异常"
+        return True
+    remind = False
+    try:
+        # 更新节点基础信息
+        client.enable_GP_cost = enable_GP_cost
+        client.EX = status_data.get("EX")
+        client.Free = status_data.get("Free")
+        client.GP = status_data.get("GP")
+        client.Credits = status_data.get("Credits")
+
+        # 判定节点状态
+        client.status = "正常"
+        if client.EX != "EX":
+            client.status = "无法访问ex站点! "
+        elif not client.Free and not client.enable_GP_cost:
+            client.status = "配额不足! "
+        elif not (client.GP and client.Credits):
+            client.status = "无法获取GP/C余额! "
+            remind = True
+        elif (
+            not client.Free
+            and int(client.GP) < 50000
+            and int(client.Credits) < 10000
+        ):
+            client.status = "GP/C不足! "
+
+    except Exception as e:
+        logger.error(f"刷新节点 {client.url} 状态时发生错误: {e}")
+        client.status = "状态信息获取失败，请检查节点！"
+        remind = True
+    return remind
+
+
 async def refresh_client_status(client: Client, app=None) -> None:
     """刷新单个节点状态"""
+    before = status_fields(client)
     status_data, enable_GP_cost = await fetch_status(client.url)
-    remind = False
     if status_data is None:
-        client.status = "网络异常"
-        remind = True
+        trip(client.url)
     else:
-        try:
-            # 更新节点基础信息
-            client.enable_GP_cost = enable_GP_cost
-            client.EX = status_data.get("EX")
-            client.Free = status_data.get("Free")
-            client.GP = status_data.get("GP")
-            client.Credits = status_data.get("Credits")
-
-            # 判定节点状态
-            client.status = "正常"
-            if client.EX != "EX":
-                client.status = "无法访问ex站点! "
-            elif not client.Free and not client.enable_GP_cost:
-                client.status = "配额不足! "
-            elif not (client.GP and client.Credits):
-                client.status = "无法获取GP/C余额! "
-                remind = True
-            elif (
-                not client.Free
-                and int(client.GP) < 50000
-                and int(client.Credits) < 10000
-            ):
-                client.status = "GP/C不足! "
-
-        except Exception as e:
-            logger.error(f"刷新节点 {client.url} 状态时发生错误: {e}")
-            client.status = "状态信息获取失败，请检查节点！"
-            remind = True
+        record_success(client.url)
+    remind = apply_client_status(client, status_data, enable_GP_cost)
 
     if remind and app:
         text = f"节点异常\nURL：{client.url}\n状态：{status_data}"
@@ -67,14 +134,120 @@ async def refresh_client_status(client: Client, app=None) -> None:
             text,
             reply_markup=InlineKeyboardMarkup(keyboard),
         )
-    await client.save()
+    await save_client_status(client, before)
+
+
+async def handle_client_push(push_key: str, status: dict) -> Client | None:
+    """处理节点主动推送的状态，推送凭证无效时返回 None"""
+    client = await Client.get_or_none(push_key=push_key)
+    if not client:
+        return None
+    last_push[client.id] = time.time()
+    record_client_queue(client.url, status)
+    record_success(client.url)
+    # 已停用的节点只能由提供者手动启用
+    if client.status != "停用":
+        before = status_fields(client)
+        apply_client_status(client, status["msg"], status["enable_GP_cost"])
+        await _update_unless_suspended(client, before)
+    return client
+
+
+async def _update_unless_suspended(client: Client, before: dict) -> None:
+    """写入变化的状态字段，条件更新避免覆盖并发的停用操作"""
+    changed = changed_fields(client, before)
+    if changed and await Client.filter(id=client.id).exclude(status="停用").update(
+        **changed
+    ):
+        update_node(client)
+
+
+async def get_push_key(client: Client) -> str:
+    """获取节点的推送凭证，旧节点首次查看时生成"""
+    if not client.push_key:
+        client.push_key = str(uuid4())
+        await client.save(update_fields=["push_key"])
+    return client.push_key
+
+
+def is_pushing(client: Client) -> bool:
+    """节点近期是否推送过状态"""
+    pushed = last_push.get(client.id)
+    return pushed is not None and time.time() - pushed < HEARTBEAT_TIMEOUT
+
+
+def record_client_seen(client: Client) -> None:
+    """解析响应中带有节点状态，视为一次状态确认"""
+    last_resolve[client.id] = time.time()
+
+
+def needs_refresh(client: Client) -> bool:
+    """停用、近期推送过状态或近期由解析响应确认正常的节点无需定时刷新"""
+    if client.status == "停用" or is_pushing(client):
+        return False
+    seen = last_resolve.get(client.id)
+    recently_seen = seen is not None and time.time() - seen < REFRESH_INTERVAL
+    return not (recently_seen and client.status == "正常")
 
 
 async def refresh_all_clients(app=None):
-    """刷新所有节点状态"""
-    clients = await Client.all()
-    tasks = [refresh_client_status(c, app) for c in clients if c.status != "停用"]
-    await asyncio.gather(*tasks)
+    """刷新所有节点状态
+
+    各节点在刷新周期的前 80% 内随机延迟后刷新，并限制同时刷新的节点数，
+    避免每小时集中发起连接与写入数据库
+    """
+    semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+    async def refresh(client_id: int):
+        await asyncio.sleep(random.uniform(0, REFRESH_INTERVAL * 0.8))
+        # 等待期间节点可能已被编辑、停用或删除，使用注册表中的最新数据
+        client = nodes.get(client_id)
+        if client is None or not needs_refresh(client):
+            return
+        async with semaphore:
+            await refresh_client_status(client, app)
+
+    clients = [c for c in await get_nodes() if needs_refresh(c)]
+    await asyncio.gather(*[refresh(c.id) for c in clients])
+
+
+async def check_client_heartbeats(app=None):
+    """推送中断的节点立即主动拉取一次状态，之后随定时刷新拉取"""
+    stale = [
+        client_id for client_id in list(last_push)
+        if time.time() - last_push[client_id] >= HEARTBEAT_TIMEOUT
+    ]
+    for client_id in stale:
+        last_push.pop(client_id, None)
+    clients = await Client.filter(id__in=stale).exclude(status="停用")
+    for client in clients:
+        logger.warning(f"节点 {client.url} 超过 {HEARTBEAT_TIMEOUT} 秒未推送状态")
+    await asyncio.gather(*[refresh_client_status(c, app) for c in clients])
+
+
+async def probe_open_clients(app=None):
+    """对冷却结束的熔断节点进行半开探测，探测成功即恢复调度"""
+    urls = due_probes()
+    if not urls:
+        return
+    clients = {
+        c.url: c for c in await Client.filter(url__in=urls).exclude(status="停用")
+    }
+    for url in urls:
+        if url not in clients:
+            forget(url)
+    await asyncio.gather(*[_probe_client(c) for c in clients.values()])
+
+
+async def _probe_client(client: Client) -> None:
+    status_data, enable_GP_cost = await fetch_status(client.url)
+    if status_data is None:
+        record_failure(client.url)
+        return
+    before = status_fields(client)
+    apply_client_status(client, status_data, enable_GP_cost)
+    await _update_unless_suspended(client, before)
+    record_success(client.url)
 
 
 async def add_client(user_id: int, url: str) -> tuple[bool, str, bool | None]:
@@ -83,9 +256,10 @@ async def add_client(user_id: int, url: str) -> tuple[bool, str, bool | None]:
     if status_data is None:
         return False, "获取节点状态失败", None
 
-    await Client.create(
+    client = await Client.create(
         provider=await User.get(id=user_id),
         url=url,
+        push_key=str(uuid4()),
         status="正常",
         enable_GP_cost=enable_GP_cost,
         EX=status_data.get("EX"),
@@ -93,22 +267,11 @@ async def add_client(user_id: int, url: str) -> tuple[bool, str, bool | None]:
         GP=status_data.get("GP"),
         Credits=status_data.get("Credits"),
     )
+    update_node(client)
     return True, "正常", enable_GP_cost
 
 
 async def get_available_clients(require_GP: int, timeout: int) -> list[Client]:
     """获取可用节点"""
-    clients = []
-    c = await Client.all()
-    for x in c:
-        if x.enable_GP_cost == 0 and str(x.Free) == "0":
-            continue
-        if timeout == 1 and x.enable_GP_cost == 0:
-            continue
-        if x.status == "正常":
-            if x.GP != "None":
-                if int(x.GP) >= int(require_GP):
-                    clients.append(x)
-
-    random.shuffle(clients)
-    return clients
+    clients = await find_candidates(int(require_GP), timeout)
+    return rank_clients([c for c in clients if not is_open(c.url)], client_queues)
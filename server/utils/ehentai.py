@@ -1,9 +1,9 @@
-import re, math
+import asyncio, re, math
 
 import httpx
-from bs4 import BeautifulSoup
 
 from config.config import cfg
+from utils.archiver import archiver_strongs, cost_to_GP, is_login_bounce
 from utils.http_client import http
 
 EX_BASE_URL = "https://exhentai.org"
@@ -28,12 +28,72 @@ def _get_base_url():
 base_url = _get_base_url()
 
 
+# gdata 合并请求：窗口期内的查询合并为一次 api.php 请求（单次最多 25 个画廊）
+GDATA_BATCH_WINDOW = cfg.get("gdata_batch_window", 0.05)
+GDATA_BATCH_SIZE = max(1, min(cfg.get("gdata_batch_size", 25), 25))
+
+# bot 与 API 运行在不同线程的事件循环中，按事件循环分别攒批
+# loop -> (待查询列表 [(gid, token, future)], 定时器)
+_gdata_batches = {}
+# 保留进行中的合并请求任务的引用，避免被垃圾回收导致等待者永久挂起
+_gdata_tasks = set()
+
+
+def _dispatch_gdata_batch(loop):
+    batch = _gdata_batches.pop(loop, None)
+    if not batch:
+        return
+    items, timer = batch
+    timer.cancel()
+    task = loop.create_task(_fetch_gdata_batch(items))
+    _gdata_tasks.add(task)
+    task.add_done_callback(_gdata_tasks.discard)
+
+
+async def _fetch_gdata_batch(items):
+    gidlist = list({(str(gid), token): [gid, token] for gid, token, _ in items}.values())
+    try:
+        url = "https://e-hentai.org/api.php"
+        data = {"method": "gdata", "gidlist": gidlist, "namespace": 1}
+        response = await http.post(url, headers=headers, json=data)
+        # 同一 gid 可能以不同 token 出现，按请求顺序对应结果（EH 按 gidlist 顺序返回），
+        # 并核对 gid 防止错位
+        results = {
+            (str(gid), token): r
+            for (gid, token), r in zip(gidlist, response.json().get("gmetadata"))
+            if str(r.get("gid")) == str(gid)
+        }
+    except Exception as e:
+        for _, _, future in items:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for gid, token, future in items:
+        if future.done():
+            continue
+        result = results.get((str(gid), token))
+        if result is None or "error" in result:
+            future.set_exception(
+                RuntimeError(f"获取画廊 {gid} 信息失败：{result and result['error']}")
+            )
+        else:
+            future.set_result(result)
+
+
 async def get_gdata(gid, token):
-    url = "https://e-hentai.org/api.php"
-    data = {"method": "gdata", "gidlist": [[gid, token]], "namespace": 1}
-    response = await http.post(url, headers=headers, json=data)
-    result = response.json().get("gmetadata")[0]
-    return result
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    if loop not in _gdata_batches:
+        timer = loop.call_later(GDATA_BATCH_WINDOW, _dispatch_gdata_batch, loop)
+        _gdata_batches[loop] = ([], timer)
+    items, _ = _gdata_batches[loop]
+    items.append((gid, token, future))
+    if len(items) >= GDATA_BATCH_SIZE:
+        _dispatch_gdata_batch(loop)
+
+    return await future
 
 
 async def get_GP_cost(gid, token):
@@ -69,22 +129,22 @@ async def get_GP_cost(gid, token):
     require_GP = {"org": None, "res": None, "pre": None}
     url = f"{base_url}/archiver.php?gid={gid}&token={token}"
     response = await http.post(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
-    GPs = soup.find_all("strong")
-    if not GPs[0]:
-        if response.url == "https://e-hentai.org/bounce_login.php?b=d&bt=1-4":
+    GPs = archiver_strongs(response.text)
+    if not GPs:
+        if is_login_bounce(response.url, response.text):
             return "服务器cookie异常"
-    for index, x in enumerate(GPs):
-        if x.text == "Free!":
+        raise ValueError(f"画廊 {gid} 归档页面解析失败")
+    for index, x in enumerate(GPs[:4]):
+        if x == "Free!":
             if index == 0:
-                require_GP["org"] = round(float(convert_to_mib(GPs[1].text)))
+                require_GP["org"] = round(float(convert_to_mib(GPs[1])))
             elif index == 2:
-                require_GP['res'] = round(float(convert_to_mib(GPs[3].text)))
+                require_GP['res'] = round(float(convert_to_mib(GPs[3])))
         else:
             if index == 0:
-                require_GP["org"] = "".join([ch for ch in GPs[0].text if ch.isdigit()]) 
+                require_GP["org"] = cost_to_GP(GPs[0])
             elif index == 2:
-                require_GP['res'] = "".join([ch for ch in GPs[2].text if ch.isdigit()])
+                require_GP['res'] = cost_to_GP(GPs[2])
     if require_GP['res']:
         x = int(require_GP['res']) * 5
         require_GP['pre'] = math.ceil(x)
@@ -0,0 +1,108 @@
+import time
+
+from loguru import logger
+from tortoise.expressions import Q
+
+from config.config import cfg
+from db.db import GalleryCache
+from utils.ehentai import get_gdata, get_GP_cost
+from utils.ttl_cache import TTLCache
+
+# gdata 基本不变，缓存时间长；GP 消耗随配额/站点变化，缓存时间短
+GDATA_TTL = cfg.get("gdata_cache_ttl", 86400)
+GP_COST_TTL = cfg.get("GP_cost_cache_ttl", 600)
+MEMORY_TTL = cfg.get("gallery_memory_cache_ttl", 300)
+
+# (gid, token) -> {"gdata", "gdata_time", "GP_cost", "GP_cost_time"}
+memory_cache = TTLCache(cfg.get("gallery_memory_cache_size", 2000), MEMORY_TTL)
+cache_stats = {
+    kind: {"memory_hit": 0, "db_hit": 0, "miss": 0} for kind in ("gdata", "GP_cost")
+}
+
+
+def _fresh(entry: dict, kind: str, ttl: int, now: float) -> bool:
+    return entry.get(kind) is not None and now - entry.get(f"{kind}_time", 0) < ttl
+
+
+async def _load(key: tuple[str, str], kind: str, ttl: int, fetch):
+    now = time.time()
+    entry = memory_cache.get(key)
+    if entry and _fresh(entry, kind, ttl, now):
+        cache_stats[kind]["memory_hit"] += 1
+        return entry[kind]
+
+    row = await GalleryCache.get_or_none(gid=key[0], token=key[1])
+    if row:
+        entry = {
+            "gdata": row.gdata,
+            "gdata_time": row.gdata_time,
+            "GP_cost": row.GP_cost,
+            "GP_cost_time": row.GP_cost_time,
+        }
+        memory_cache.set(key, entry)
+        if _fresh(entry, kind, ttl, now):
+            cache_stats[kind]["db_hit"] += 1
+            return entry[kind]
+
+    cache_stats[kind]["miss"] += 1
+    value = await fetch(*key)
+    # GP 消耗解析失败时返回的是错误字符串，不写入缓存
+    if kind == "GP_cost" and not isinstance(value, dict):
+        return value
+
+    now = time.time()
+    entry = memory_cache.get(key) or {}
+    entry.update({kind: value, f"{kind}_time": now})
+    memory_cache.set(key, entry)
+    await GalleryCache.update_or_create(
+        defaults={kind: value, f"{kind}_time": now}, gid=key[0], token=key[1]
+    )
+    return value
+
+
+async def get_cached_gdata(gid, token):
+    """带缓存的 get_gdata"""
+    return await _load((str(gid), token), "gdata", GDATA_TTL, get_gdata)
+
+
+async def get_cached_GP_cost(gid, token):
+    """带缓存的 get_GP_cost"""
+    return await _load((str(gid), token), "GP_cost", GP_COST_TTL, get_GP_cost)
+
+
+def peek_GP_cost(gid, token) -> tuple[dict, float] | None:
+    """从内存缓存中读取 GP 消耗及其获取时间，不触发查询"""
+    entry = memory_cache.peek((str(gid), token))
+    if entry and entry.get("GP_cost") is not None:
+        return entry["GP_cost"], entry["GP_cost_time"]
+    return None
+
+
+async def invalidate_gallery_cache(gid, token, GP_cost_only: bool = False):
+    """使画廊缓存失效，GP_cost_only 为真时保留 gdata"""
+    key = (str(gid), token)
+    if GP_cost_only:
+        if entry := memory_cache.get(key):
+            entry.pop("GP_cost", None)
+        await GalleryCache.filter(gid=key[0], token=key[1]).update(
+            GP_cost=None, GP_cost_time=0
+        )
+    else:
+        memory_cache.pop(key, None)
+        await GalleryCache.filter(gid=key[0], token=key[1]).delete()
+
+
+async def clean_gallery_cache(_):
+    """清理过期的画廊缓存"""
+    now = time.time()
+    memory_cache.expire()
+
+    deleted = await GalleryCache.filter(
+        Q(gdata_time__lt=now - GDATA_TTL) & Q(GP_cost_time__lt=now - GP_COST_TTL)
+    ).delete()
+    logger.info(f"清理过期画廊缓存 {deleted} 条")
+
+
+def get_cache_stats() -> dict:
+    """返回各类缓存的命中统计"""
+    return {kind: dict(stats) for kind, stats in cache_stats.items()}
@@ -0,0 +1,110 @@
+"""进程内的节点注册表
+
+启动时从数据库加载一次，之后由各写入路径（添加、编辑、刷新、推送、解析反馈）
+同步更新。可用节点按能力索引：
+
+    (有免费配额, 允许消耗 GP) -> GP 余额分桶 -> {节点 id: (GP 余额, Client)}
+
+GP 余额按二进制位数分桶，选取候选节点时高于所需分桶的节点无需比较余额，
+不再查询数据库，也不再逐行解析字符串字段。
+"""
+
+import threading
+
+from db.db import Client
+
+# 节点 id -> Client，包括停用与异常的节点
+nodes = {}
+# (有免费配额, 允许消耗 GP) -> {GP 分桶: {节点 id: (GP 余额, Client)}}，仅包含状态正常的节点
+_index = {}
+# 节点 id -> 所在的索引位置 (能力, GP 分桶)
+_positions = {}
+_lock = threading.Lock()
+_loaded = False
+
+
+def _parse_GP(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bucket(GP: int) -> int:
+    return max(GP, 0).bit_length()
+
+
+def _unindex(client_id: int) -> None:
+    if position := _positions.pop(client_id, None):
+        capability, bucket = position
+        _index[capability][bucket].pop(client_id, None)
+
+
+def _put(client: Client) -> None:
+    _unindex(client.id)
+    nodes[client.id] = client
+    # 状态正常已包含可访问 EX 站点，其余状态的节点不参与调度
+    GP = _parse_GP(client.GP)
+    if client.status != "正常" or GP is None:
+        return
+    capability = (str(client.Free) != "0", bool(client.enable_GP_cost))
+    if capability == (False, False):
+        return
+    bucket = _bucket(GP)
+    _index.setdefault(capability, {}).setdefault(bucket, {})[client.id] = (GP, client)
+    _positions[client.id] = (capability, bucket)
+
+
+async def load_registry() -> None:
+    """从数据库加载全部节点"""
+    global _loaded
+    clients = await Client.all()
+    with _lock:
+        nodes.clear()
+        _index.clear()
+        _positions.clear()
+        for client in clients:
+            _put(client)
+        _loaded = True
+
+
+def update_node(client: Client) -> None:
+    """节点写入数据库后同步到注册表"""
+    with _lock:
+        # 尚未加载时由加载过程读取最新数据
+        if _loaded:
+            _put(client)
+
+
+def remove_node(client_id: int) -> None:
+    with _lock:
+        _unindex(client_id)
+        nodes.pop(client_id, None)
+
+
+async def get_nodes() -> list[Client]:
+    """全部节点"""
+    if not _loaded:
+        await load_registry()
+    with _lock:
+        return list(nodes.values())
+
+
+async def find_candidates(require_GP: int, timeout: int) -> list[Client]:
+    """GP 余额不少于 require_GP 的正常节点，timeout 为 1 时只选允许消耗 GP 的节点"""
+    if not _loaded:
+        await load_registry()
+    min_bucket = _bucket(require_GP)
+    candidates = []
+    with _lock:
+        for (free, GP_cost), buckets in _index.items():
+            if timeout == 1 and not GP_cost:
+                continue
+            for bucket, clients in buckets.items():
+                if bucket > min_bucket:
+                    candidates.extend(c for _, c in clients.values())
+                elif bucket == min_bucket:
+                    candidates.extend(
+                        c for GP, c in clients.values() if GP >= require_GP
+                    )
+    return candidates
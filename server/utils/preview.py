@@ -16,7 +16,7 @@ from loguru import logger
 from config.config import cfg
 from utils.http_client import http
 from db.db import Preview
-from utils.GP_action import deduct_GP, get_current_GP
+from utils.GP_action import get_current_GP, refund_GP, reserve_GP
 from utils.resolve import get_download_url, get_gallery_info
 
 task_list = []
@@ -165,11 +165,20 @@ async def get_gallery_images(gid, token, mes, user):
                 await mes_edit_text(mes, "❌ 画廊解析失败，请检查链接或稍后再试")
                 logger.error(f"画廊 https://exhentai.org/g/{gid}/{token} 解析失败：{e}")
                 return
-            d_url = await get_download_url(
-                user, gid, token, "res", int(require_GP['res']), timeout
-            )
+            # 请求节点前预扣 GP，未获得链接时退还
+            reserved = await reserve_GP(user, int(require_GP['res']))
+            if reserved is None:
+                await mes_edit_text(mes, f"⚠️ GP 不足，当前余额：{get_current_GP(user)}")
+                return
+            d_url = None
+            try:
+                d_url = await get_download_url(
+                    user, gid, token, "res", int(require_GP['res']), timeout
+                )
+            finally:
+                if not d_url:
+                    await refund_GP(user, reserved)
             if d_url:
-                await deduct_GP(user, int(require_GP['res']))
                 await mes_edit_text(mes, "获取下载链接成功, 开始下载...")
                 os.makedirs(f"{cfg['download_folder']}", exist_ok=True)
                 dow = await async_multithread_download(d_url + "1?start=1", f"{gid}.zip", parts=cfg['preview_download_thread'])
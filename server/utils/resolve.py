@@ -1,3 +1,4 @@
+import asyncio
 from collections import defaultdict
 from datetime import datetime
 import time, html
@@ -5,10 +6,20 @@ from urllib.parse import urljoin
 
 from loguru import logger
 
-from db.db import ArchiveHistory
-from utils.client import get_available_clients
-from utils.ehentai import get_gdata, get_GP_cost
+from config.config import cfg
+from db.db import ArchiveHistory, Client
+from utils.breaker import record_failure, record_success
+from utils.client import (
+    apply_client_status,
+    get_available_clients,
+    record_client_queue,
+    record_client_seen,
+    save_client_status,
+    status_fields,
+)
+from utils.gallery_cache import get_cached_gdata, get_cached_GP_cost, peek_GP_cost
 from utils.http_client import http
+from utils.scheduler import hedge_delay, record_latency, record_result
 
 
 async def fetch_tag_map(_):
@@ -30,10 +41,29 @@ async def fetch_tag_map(_):
         )
 
 
+# 同时请求的节点数上限，1 为关闭对冲
+HEDGE_MAX_PARALLEL = cfg.get("hedge_max_parallel", 2)
+
+# 进行中的画廊信息查询，key 包含事件循环（bot 与 API 运行在不同线程）
+gallery_info_tasks = {}
+
+
 async def get_gallery_info(gid, token):
-    """获取画廊基础信息 + 缩略图"""
-    require_GP = await get_GP_cost(gid, token)
-    gallery_info = await get_gdata(gid, token)
+    """获取画廊基础信息 + 缩略图，同一画廊的并发查询共享同一次计算"""
+    key = (asyncio.get_running_loop(), str(gid), token)
+    task = gallery_info_tasks.get(key)
+    if not task:
+        task = asyncio.create_task(_get_gallery_info(gid, token))
+        gallery_info_tasks[key] = task
+        task.add_done_callback(lambda _: gallery_info_tasks.pop(key, None))
+    # shield：单个调用方被取消时不影响其他等待者
+    return await asyncio.shield(task)
+
+
+async def _get_gallery_info(gid, token):
+    require_GP, gallery_info = await asyncio.gather(
+        get_cached_GP_cost(gid, token), get_cached_gdata(gid, token)
+    )
 
     new_tags = defaultdict(list)
     for item in gallery_info["tags"]:
@@ -82,50 +112,142 @@ async def get_gallery_info(gid, token):
 
 async def get_download_url(user, gid, token, image_quality, require_GP, timeout):
     """向可用节点请求下载链接"""
+    d_url, _ = await request_download_url(
+        user, gid, token, image_quality, require_GP, timeout
+    )
+    return d_url
+
+
+async def request_download_url(user, gid, token, image_quality, require_GP, timeout):
+    """向可用节点请求下载链接，返回 (下载链接, 解析成功的节点)"""
     clients = await get_available_clients(int(require_GP), timeout)
     if not clients:
-        return None
-    for client in clients:
-        try:
-            response = await http.post(
-                urljoin(client.url, "/resolve"),
-                json={
-                    "username": user.name,
-                    "gid": gid,
-                    "token": token,
-                    "image_quality": image_quality,
-                },
-                timeout=60,
+        return None, None
+    payload = {
+        "username": user.name,
+        "gid": gid,
+        "token": token,
+        "image_quality": image_quality,
+    }
+    # 附带缓存中的 GP 消耗及其缓存时长，节点可据此跳过一次消耗查询
+    if cached := peek_GP_cost(gid, token):
+        GP_cost, GP_cost_time = cached
+        if str(GP_cost.get(image_quality)) == str(require_GP):
+            payload["expected_GP"] = int(require_GP)
+            payload["expected_GP_age"] = round(time.time() - GP_cost_time, 1)
+    # 对冲请求：当前节点超过其 p90 延迟未返回时同时请求下一个节点，先成功者胜出
+    candidates = iter(clients)
+    pending = {}  # task -> client
+
+    def launch() -> Client | None:
+        client = next(candidates, None)
+        if client:
+            task = asyncio.create_task(_request_client(client, payload, gid, token))
+            pending[task] = client
+        return client
+
+    last = launch()
+    winner = None
+    try:
+        while pending:
+            timeout = None
+            if len(pending) < HEDGE_MAX_PARALLEL:
+                timeout = hedge_delay(last.url)
+            done, _ = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
             )
-            data = response.json()
-
-            # 更新节点状态
-            status = data["status"]["msg"]
-            if status["Free"] == 0 and client.enable_GP_cost == 0:
-                client.status = "配额不足，停止解析"
-            client.EX = status["EX"]
-            client.GP = status["GP"]
-            client.Credits = status["Credits"]
-            client.enable_GP_cost = data["status"]["enable_GP_cost"]
-            await client.save()
-
-            if data.get("msg") == "Success":
-                await ArchiveHistory.create(
-                    user=user,
-                    gid=gid,
-                    token=token,
-                    GP_cost=data["require_GP"],
-                    client=client,
-                )
-                logger.info(
-                    f"节点 {client.url} 解析 https://e-hentai.org/g/{gid}/{token}/ 成功"
-                )
-                return data["d_url"].replace("?autostart=1", "").replace("?start=1", "")[:-1]
-            error_msg = data.get("msg")
-        except Exception as e:
-            client.status = "异常"
-            await client.save()
-            error_msg = e
-        logger.error(
-            f"节点 {client.url} 解析 https://e-hentai.org/g/{gid}/{token}/ 失败：{error_msg}"
+            if not done:
+                if hedged := launch():
+                    logger.info(
+                        f"节点 {last.url} 超过 {timeout:.1f} 秒未返回，对冲请求节点 {hedged.url}"
+                    )
+                    last = hedged
+                continue
+            failed = 0
+            for task in done:
+                client = pending.pop(task)
+                data = task.result()
+                if data is None:
+                    failed += 1
+                    continue
+                if winner is None:
+                    winner = client, data
+                else:
+                    logger.warning(
+                        f"节点 {client.url} 与 {winner[0].url} 均解析成功，仅使用 {winner[0].url} 的结果"
+                    )
+            if winner:
+                break
+            # 失败释放的名额立即转投下一个节点，不再等待对冲延迟
+            for _ in range(failed):
+                if len(pending) >= HEDGE_MAX_PARALLEL:
+                    break
+                last = launch() or last
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if not winner:
+        return None, None
+    # 只为胜出的节点记录一次解析历史
+    client, data = winner
+    await ArchiveHistory.create(
+        user=user,
+        gid=gid,
+        token=token,
+        GP_cost=data["require_GP"],
+        client=client,
+    )
+    logger.info(f"节点 {client.url} 解析 https://e-hentai.org/g/{gid}/{token}/ 成功")
+    return (
+        data["d_url"].replace("?autostart=1", "").replace("?start=1", "")[:-1],
+        client,
+    )
+
+
+async def _request_client(client: Client, payload: dict, gid, token) -> dict | None:
+    """请求单个节点并更新其状态，成功时返回节点响应，否则返回 None"""
+    start = time.monotonic()
+    try:
+        response = await http.post(
+            urljoin(client.url, "/resolve"), json=payload, timeout=60
         )
+        data = response.json()
+        record_success(client.url)
+        record_client_queue(client.url, data["status"])
+        # 繁忙与 GP 限额拒绝不计入节点的成功率
+        if data.get("msg") not in ("Busy", "Rejected"):
+            record_result(
+                client.url, time.monotonic() - start, data.get("msg") == "Success"
+            )
+        if data.get("msg") == "Busy":
+            # 节点队列已满，不影响其状态，直接尝试下一个节点
+            logger.warning(f"节点 {client.url} 繁忙，转投其他节点")
+            return None
+
+        # 按节点返回的状态重新判定节点状态，与定时刷新一致
+        before = status_fields(client)
+        apply_client_status(
+            client, data["status"]["msg"], data["status"]["enable_GP_cost"]
+        )
+        await save_client_status(client, before)
+
+        if data.get("msg") == "Success":
+            # 仅解析成功视为节点健康的确认，定时刷新可跳过该节点
+            record_client_seen(client)
+            return data
+        error_msg = data.get("msg")
+    except asyncio.CancelledError:
+        # 对冲落败被取消：已耗时作为延迟的下限计入 EWMA，使开始变慢的节点排序后移；
+        # 正常节点约 10% 的请求会超过 p90，不计为失败，成功率与熔断只看真实错误
+        record_latency(client.url, time.monotonic() - start)
+        raise
+    except Exception as e:
+        record_result(client.url, time.monotonic() - start, False)
+        # 连续异常时熔断，由半开探测恢复，不再等待每小时的状态刷新
+        record_failure(client.url)
+        error_msg = e
+    logger.error(
+        f"节点 {client.url} 解析 https://e-hentai.org/g/{gid}/{token}/ 失败：{error_msg}"
+    )
+    return None
@@ -0,0 +1,123 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from config.config import cfg
+
+# EWMA 平滑系数，越大越看重最近的结果
+EWMA_ALPHA = cfg.get("node_ewma_alpha", 0.3)
+# 尚无记录的节点按此延迟(秒)与成功率估计，保证新节点也会被尝试
+PRIOR_LATENCY = cfg.get("node_prior_latency", 10)
+PRIOR_SUCCESS = 0.9
+# 最近连续失败的节点在冷却时间内额外增加的期望耗时(秒/次)
+FAILURE_PENALTY = cfg.get("node_failure_penalty", 30)
+FAILURE_COOLDOWN = cfg.get("node_failure_cooldown", 600)
+# 对冲请求：节点超过其 p90 延迟仍未返回时，同时请求下一个节点
+HEDGE_DEFAULT_DELAY = cfg.get("hedge_default_delay", 15)
+HEDGE_MIN_DELAY = cfg.get("hedge_min_delay", 3)
+HEDGE_MIN_SAMPLES = 5
+
+
+class NodeStats:
+    def __init__(self):
+        self.latency = PRIOR_LATENCY
+        self.success_rate = PRIOR_SUCCESS
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.recent = deque(maxlen=50)  # 最近成功解析的耗时
+
+
+# 节点 URL -> NodeStats，bot 与 API 在不同线程中更新
+node_stats = {}
+_lock = threading.Lock()
+# 最近的调度决策，供管理员查看
+recent_decisions = deque(maxlen=20)
+
+
+def record_result(url: str, latency: float, success: bool) -> None:
+    """记录一次节点解析结果"""
+    with _lock:
+        stats = node_stats.setdefault(url, NodeStats())
+        stats.latency += EWMA_ALPHA * (latency - stats.latency)
+        stats.success_rate += EWMA_ALPHA * (int(success) - stats.success_rate)
+        stats.samples += 1
+        if success:
+            stats.consecutive_failures = 0
+            stats.recent.append(latency)
+        else:
+            stats.consecutive_failures += 1
+            stats.last_failure = time.time()
+
+
+def record_latency(url: str, latency: float) -> None:
+    """记录一次未完成请求的耗时（如对冲落败被取消），只计入延迟，不影响成功率"""
+    with _lock:
+        stats = node_stats.setdefault(url, NodeStats())
+        stats.latency += EWMA_ALPHA * (latency - stats.latency)
+
+
+def expected_time(url: str, queue: dict | None = None) -> float:
+    """期望获得可用链接的耗时
+
+    每次尝试耗时约为 EWMA 延迟，期望尝试次数为 1 / 成功率；
+    节点排队时按并发数折算等待时间，近期连续失败的节点额外加罚。
+    """
+    stats = node_stats.get(url) or NodeStats()
+    cost = stats.latency / max(stats.success_rate, 0.05)
+    if queue and queue.get("max_concurrency"):
+        cost *= 1 + (queue["waiting"] + queue["in_flight"]) / queue["max_concurrency"]
+    if time.time() - stats.last_failure < FAILURE_COOLDOWN:
+        cost += FAILURE_PENALTY * stats.consecutive_failures
+    return cost
+
+
+def hedge_delay(url: str) -> float:
+    """等待该节点多久后发出对冲请求：样本足够时取 p90，否则取默认值"""
+    stats = node_stats.get(url)
+    if not stats or len(stats.recent) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    recent = sorted(stats.recent)
+    return max(recent[math.ceil(len(recent) * 0.9) - 1], HEDGE_MIN_DELAY)
+
+
+def rank_clients(clients: list, queues: dict) -> list:
+    """按期望耗时排序候选节点，队列已满的节点排在最后"""
+
+    def key(client):
+        queue = queues.get(client.url)
+        full = bool(queue) and queue["waiting"] >= queue["max_queue"]
+        return full, expected_time(client.url, queue)
+
+    # 先打乱，期望耗时相同（如均无记录）的节点随机选择
+    clients = list(clients)
+    random.shuffle(clients)
+    clients.sort(key=key)
+    if clients:
+        recent_decisions.append(
+            (time.time(), [(c.url, round(key(c)[1], 1)) for c in clients])
+        )
+    return clients
+
+
+def get_routing_table(urls: list[str], queues: dict) -> list[dict]:
+    """各节点的调度参数"""
+    table = []
+    for url in urls:
+        stats = node_stats.get(url) or NodeStats()
+        table.append(
+            {
+                "url": url,
+                "latency": stats.latency,
+                "success_rate": stats.success_rate,
+                "samples": stats.samples,
+                "consecutive_failures": stats.consecutive_failures,
+                "queue": queues.get(url),
+                "expected_time": expected_time(url, queues.get(url)),
+                "hedge_delay": hedge_delay(url),
+            }
+        )
+    table.sort(key=lambda row: row["expected_time"])
+    return table
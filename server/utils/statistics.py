@@ -1,3 +1,4 @@
+import html
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
@@ -6,7 +7,12 @@ from zoneinfo import ZoneInfo
 from openpyxl import Workbook
 
 from db.db import ArchiveHistory, Client, User
+from utils.api import results_cache, shared_archive_cache
+from utils.client import client_queues
+from utils.gallery_cache import get_cache_stats
 from utils.GP_action import get_current_GP
+from utils.breaker import get_breaker_state
+from utils.scheduler import get_routing_table, recent_decisions
 
 
 async def get_client_statistics(clients=None):
@@ -87,6 +93,77 @@ async def get_usage_statistics(clients=None, user=None):
     )
 
 
+def get_cache_statistics():
+    names = {"gdata": "画廊信息", "GP_cost": "GP 消耗"}
+    lines = ["🗃 缓存统计：", "<blockquote expandable>"]
+    for kind, stats in get_cache_stats().items():
+        total = sum(stats.values())
+        hit_ratio = (stats["memory_hit"] + stats["db_hit"]) / total if total else 0
+        lines.append(
+            f"    {names[kind]}：内存命中 {stats['memory_hit']}，"
+            f"数据库命中 {stats['db_hit']}，未命中 {stats['miss']}，"
+            f"命中率 {hit_ratio:.1%}"
+        )
+    for name, cache in (("解析结果", results_cache), ("共享链接", shared_archive_cache)):
+        stats = cache.stats()
+        lines.append(
+            f"    {name}：条目 {stats['size']}/{stats['maxsize']}，"
+            f"命中率 {stats['hit_ratio']:.1%}，淘汰 {stats['evictions']}，"
+            f"过期 {stats['expirations']}"
+        )
+    lines.append("</blockquote>")
+    return "\n".join(lines)
+
+
+# 调度统计的节点行总长度与最近决策显示的节点数上限
+ROUTING_TEXT_LIMIT = 2500
+ROUTING_DECISION_LIMIT = 10
+
+
+async def get_routing_statistics():
+    """节点调度参数与最近一次调度决策"""
+    clients = await Client.exclude(status="停用")
+    lines = ["🧭 节点调度：", "<blockquote expandable>"]
+    rows = get_routing_table([c.url for c in clients], client_queues)
+    length = 0
+    for shown, row in enumerate(rows):
+        # Telegram 单条消息上限 4096 字符，超出部分只显示数量
+        if length > ROUTING_TEXT_LIMIT:
+            lines.append(f"    …… 其余 {len(rows) - shown} 个节点未显示")
+            break
+        queue = row["queue"]
+        queue_text = (
+            f"，排队 {queue['waiting']}/{queue['max_queue']}，进行 {queue['in_flight']}"
+            if queue
+            else ""
+        )
+        breaker_text = ""
+        if breaker := get_breaker_state(row["url"]):
+            if breaker["state"] == "half_open":
+                breaker_text = "，熔断中（探测中）"
+            else:
+                breaker_text = f"，熔断中（{breaker['remaining']:.0f}s 后探测）"
+        lines.append(
+            f"    {html.escape(row['url'])}：期望 {row['expected_time']:.1f}s，"
+            f"延迟 {row['latency']:.1f}s，成功率 {row['success_rate']:.0%}，"
+            f"样本 {row['samples']}，连续失败 {row['consecutive_failures']}，"
+            f"对冲 {row['hedge_delay']:.1f}s{queue_text}{breaker_text}"
+        )
+        length += len(lines[-1])
+    if recent_decisions:
+        decided_at, order = recent_decisions[-1]
+        lines.append(
+            f"    最近决策（{datetime.fromtimestamp(decided_at):%H:%M:%S}）："
+            + " → ".join(
+                f"{html.escape(url)}({cost}s)"
+                for url, cost in order[:ROUTING_DECISION_LIMIT]
+            )
+            + (" → ……" if len(order) > ROUTING_DECISION_LIMIT else "")
+        )
+    lines.append("</blockquote>")
+    return "\n".join(lines)
+
+
 async def _create_excel(data: list[list], title_row: list[str]) -> BytesIO:
     wb = Workbook()
     ws = wb.active
@@ -100,7 +177,7 @@ async def _create_excel(data: list[list], title_row: list[str]) -> BytesIO:
 
 
 async def get_user_list_file():
-    users = await User.all().prefetch_related("archive_histories", "GP_records")
+    users = await User.all().prefetch_related("archive_histories")
     title = [
         "用户 ID",
         "用户名",
@@ -0,0 +1,100 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """带容量上限的 LRU + TTL 缓存
+
+    - 查询 / 写入 O(1)，超出容量时淘汰最久未使用的条目
+    - 过期时间由最小堆维护，过期清理只处理已到期的条目
+    - bot 与 API 运行在不同线程，内部操作加锁
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expire_time)
+        self._heap = []  # (expire_time, seq, key)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            if item[1] <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def peek(self, key, default=None):
+        """查询但不更新 LRU 顺序与命中统计"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= time.time():
+                return default
+            return item[0]
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            expire_time = time.time() + (self.ttl if ttl is None else ttl)
+            self._data[key] = (value, expire_time)
+            self._data.move_to_end(key)
+            heapq.heappush(self._heap, (expire_time, next(self._seq), key))
+
+            self._expire()
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+            # 覆盖写入 / LRU 淘汰会在堆中留下失效条目，过多时重建
+            if len(self._heap) > 2 * len(self._data) + 64:
+                self._heap = [
+                    (expire, next(self._seq), k) for k, (_, expire) in self._data.items()
+                ]
+                heapq.heapify(self._heap)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def expire(self):
+        """清理所有已过期条目"""
+        with self._lock:
+            self._expire()
+
+    def _expire(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            expire_time, _, key = heapq.heappop(self._heap)
+            item = self._data.get(key)
+            # 条目已被覆盖写入或淘汰时，堆中的记录已失效
+            if item is not None and item[1] == expire_time:
+                del self._data[key]
+                self.expirations += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / total if total else 0,
+        }
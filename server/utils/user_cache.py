@@ -0,0 +1,38 @@
+from itertools import count
+
+from config.config import cfg
+from db.db import User
+from utils.ttl_cache import TTLCache
+
+# apikey -> User（含用户组与 GP 余额）
+user_cache = TTLCache(cfg.get("user_cache_size", 5000), cfg.get("user_cache_ttl", 300))
+# user.id -> apikey，用于按用户失效
+_apikey_by_user = {}
+# 失效代数：每次失效取下一个序号，user.id -> 该用户最近一次失效时的序号
+# 查库前记下当前序号，查到的用户在此之后被失效过则不写入缓存
+_generation_counter = count(1)
+_generation = 0
+_invalidated_at = {}
+
+
+async def get_user_by_apikey(apikey: str) -> User | None:
+    """按 API Key 获取用户，优先使用缓存"""
+    user = user_cache.get(str(apikey))
+    if user is None:
+        generation = _generation
+        user = await User.get_or_none(apikey=apikey)
+        # 读取期间该用户被失效（重置 Key、封禁等），本次结果可能已过时，不写入缓存
+        if user and _invalidated_at.get(user.id, 0) <= generation:
+            user_cache.set(str(apikey), user)
+            _apikey_by_user[user.id] = str(apikey)
+    return user
+
+
+def invalidate_user(user_id: int) -> None:
+    """用户组、余额或 API Key 变化后使缓存失效"""
+    global _generation
+    _generation = next(_generation_counter)
+    _invalidated_at[int(user_id)] = _generation
+    apikey = _apikey_by_user.pop(int(user_id), None)
+    if apikey:
+        user_cache.pop(apikey)